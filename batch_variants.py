@@ -0,0 +1,129 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import copy
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from geometry_cache import GeometryCache, config_key
+from kochLamp_layered import KochSnowflake_creator, config
+
+
+def set_field(config_dict, path, value):
+    # Sets a dotted field such as "twists_list.0.amplitude"
+    keys = path.split('.')
+    target = config_dict
+    for key in keys[:-1]:
+        target = target[int(key)] if isinstance(target, list) else target[key]
+    last = keys[-1]
+    if isinstance(target, list):
+        target[int(last)] = value
+    else:
+        target[last] = value
+
+
+def expand_variants(spec):
+    """Config dicts described by a variations spec, duplicates removed.
+
+    :param dict spec: "base" (config.json name or dict), an optional "grid"
+        of dotted field -> list of values swept as a cartesian product and
+        an optional "variants" list of dotted field -> value overrides
+    :returns list: (key, config dict) pairs in spec order
+    """
+    base = spec.get('base', 'Lamp')
+    if isinstance(base, str):
+        base = config[base]
+    overrides = []
+    grid = spec.get('grid', {})
+    if grid:
+        fields = list(grid)
+        for values in itertools.product(*(grid[f] for f in fields)):
+            overrides.append(dict(zip(fields, values)))
+    overrides.extend(spec.get('variants', []))
+    if not overrides:
+        overrides = [{}]
+    variants = {}
+    for override in overrides:
+        variant = copy.deepcopy(base)
+        for path, value in override.items():
+            set_field(variant, path, value)
+        variants.setdefault(config_key(variant), variant)
+    return list(variants.items())
+
+
+def render_variant(key, config_dict, output_dir, cache_dir=None):
+    # Worker: builds one variant and writes its STL, returns a manifest row
+    start = time.perf_counter()
+    filename = os.path.join(output_dir, key[:16] + '.stl')
+    if cache_dir is not None:
+        GeometryCache(cache_dir).export(config_dict, filename)
+    else:
+        creator = KochSnowflake_creator(config_dict)
+        creator.create_mesh()
+        creator.save_as_stl(filename)
+    return {
+        'key': key,
+        'config': config_dict,
+        'stl': filename,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def run_batch(spec, workers=None, output_dir='variants', cache_dir=None):
+    """Renders every variant of spec in a process pool.
+
+    Writes one STL per distinct variant and a manifest.json with the config,
+    output path and timing of each variant (or its error) plus totals.
+
+    :param int workers: pool size, os.cpu_count() when None
+    :returns dict: the manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    variants = expand_variants(spec)
+    start = time.perf_counter()
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_variant, key, cfg, output_dir, cache_dir): (key, cfg) for key, cfg in variants}
+        for future in as_completed(futures):
+            key, cfg = futures[future]
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                rows.append({'key': key, 'config': cfg, 'error': repr(e)})
+            print("%d/%d variants done" % (len(rows), len(variants)))
+    order = {key: i for i, (key, _) in enumerate(variants)}
+    rows.sort(key=lambda row: order[row['key']])
+    manifest = {
+        'variants': rows,
+        'count': len(rows),
+        'failed': sum('error' in row for row in rows),
+        'workers': workers or os.cpu_count(),
+        'wall_seconds': time.perf_counter() - start,
+        'cpu_seconds': sum(row.get('seconds', 0) for row in rows),
+    }
+    with open(os.path.join(output_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render every variant of a variations file")
+    parser.add_argument('spec', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'variations.config'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--cache-dir', default=None)
+    args = parser.parse_args()
+
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+    manifest = run_batch(
+        spec,
+        workers=args.workers or spec.get('workers'),
+        output_dir=args.output_dir or spec.get('output_dir', 'variants'),
+        cache_dir=args.cache_dir or spec.get('cache_dir'),
+    )
+    print("%d variants in %.1f s" % (manifest['count'], manifest['wall_seconds']))
@@ -0,0 +1,197 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import koch_outline
+from kochLamp_layered import KochSnowflake_creator
+from scad_export import scad_render_modules
+from stl_writer import save_mesh_stl
+
+# Profile combinations every case is crossed with
+shapes = {
+    'plain': {},
+    'chamfer': {'chamfer_r': 0.4},
+    'twist': {'twists_list': [{'type': 'sin', 'amplitude': 20, 'period': 100, 'phase': 0}]},
+    'scale': {'scaling_list': [{'type': 'cos', 'amplitude': 5, 'period': 100, 'phase': 0}]},
+    'twist_scale': {
+        'twists_list': [{'type': 'sin', 'amplitude': 20, 'period': 100, 'phase': 0}],
+        'scaling_list': [{'type': 'cos', 'amplitude': 5, 'period': 100, 'phase': 0}],
+    },
+}
+
+
+def build_cases(iterations=range(1, 7), layer_heights=(0.2, 2, 50), shape_names=None):
+    # Case name -> config dict, for every iteration/layer height/shape triple
+    cases = {}
+    for it, hpl, name in itertools.product(iterations, layer_heights, shape_names or shapes):
+        config_dict = {
+            "height": 100,
+            "base_diameter": 50,
+            "koch_iterations": it,
+            "wall_thickness": 0.4,
+            "height_per_layer": hpl,
+            "chamfer_r": 0,
+        }
+        config_dict.update(shapes[name])
+        cases['koch%d_hpl%g_%s' % (it, hpl, name)] = config_dict
+    return cases
+
+
+def best_time(function, repeat=3):
+    # Fastest of repeat runs and the result of the last one
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_case(config_dict, repeat=3, work_dir='.', openscad=None, skip_csg=False):
+    """Times every stage of one lamp.
+
+    :returns dict: metric -> value; metrics ending in _s are seconds
+    """
+    row = {}
+    creator = KochSnowflake_creator(config_dict)
+
+    def fresh(method):
+        # Every repeat starts without cached artifacts, or it would time a lookup
+        def run():
+            creator.invalidate()
+            return method()
+        return run
+
+    def outline():
+        koch_outline.clear_cache()
+        return creator.get_outline()
+    row['outline_s'], points = best_time(fresh(outline), repeat)
+    row['outline_vertices'] = len(points)
+
+    row['mesh_s'], (vertices, faces) = best_time(fresh(creator.create_mesh), repeat)
+    row['mesh_faces'] = len(faces)
+    stl = os.path.join(work_dir, 'benchmark.stl')
+    row['stl_write_s'], _ = best_time(lambda: save_mesh_stl(stl, vertices, faces), repeat)
+    row['stl_bytes'] = os.path.getsize(stl)
+    row['stl_mb_per_second'] = row['stl_bytes']/2**20/max(row['stl_write_s'], 1e-9)
+
+    if skip_csg:
+        return row
+    row['create_s'], _ = best_time(fresh(creator.create), repeat)
+    row['scad_render_s'], source = best_time(lambda: scad_render_modules(creator.body), repeat)
+    row['scad_bytes'] = len(source.encode('utf-8'))
+    scad = os.path.join(work_dir, 'benchmark.scad')
+    row['scad_save_s'], _ = best_time(fresh(lambda: creator.save_as_scad(scad)), repeat)
+
+    if openscad:
+        start = time.perf_counter()
+        done = subprocess.run([openscad, '-o', os.path.join(work_dir, 'openscad.stl'), scad],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        row['openscad_s'] = time.perf_counter() - start
+        row['openscad_ok'] = done.returncode == 0
+    return row
+
+
+def run_benchmarks(cases, repeat=3, openscad=False, skip_csg=False, log=print):
+    """Runs all cases and returns the JSON-ready report.
+
+    :param bool openscad: also time an OpenSCAD render of each case when the
+        binary is on the PATH, skipped silently otherwise
+    """
+    binary = shutil.which('openscad') if openscad else None
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'platform': platform.platform(),
+            'openscad': binary,
+            'repeat': repeat,
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+    }
+    work_dir = tempfile.mkdtemp(prefix='koch-bench-')
+    try:
+        for name, config_dict in cases.items():
+            try:
+                row = run_case(config_dict, repeat, work_dir, binary, skip_csg)
+            except Exception as e:
+                row = {'error': repr(e)}
+            report['results'][name] = row
+            log('%-32s %s' % (name, ', '.join('%s=%.4g' % (k, v) for k, v in row.items()
+                                                   if k.endswith('_s')) or row.get('error')))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return report
+
+
+def compare_reports(old, new, threshold=0.1, min_seconds=1e-3):
+    """Timings of new that are more than threshold slower than in old.
+
+    Timings below min_seconds in both runs are ignored as noise.
+
+    :returns list: (case, metric, old seconds, new seconds, ratio) rows
+    """
+    regressions = []
+    for case, row in sorted(new['results'].items()):
+        before = old['results'].get(case, {})
+        for metric, value in sorted(row.items()):
+            if not metric.endswith('_s') or metric not in before:
+                continue
+            if max(value, before[metric]) < min_seconds:
+                continue
+            ratio = value/max(before[metric], 1e-12)
+            if ratio > 1 + threshold:
+                regressions.append((case, metric, before[metric], value, ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark outline, SCAD and STL generation")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="time all cases and write a JSON report")
+    run.add_argument('-o', '--output', default='benchmarks.json')
+    run.add_argument('--iterations', type=int, nargs='+', default=list(range(1, 7)))
+    run.add_argument('--layer-heights', type=float, nargs='+', default=[0.2, 2, 50])
+    run.add_argument('--shapes', nargs='+', choices=sorted(shapes), default=None)
+    run.add_argument('-k', '--filter', default=None, help="only cases whose name contains this")
+    run.add_argument('--repeat', type=int, default=3)
+    run.add_argument('--openscad', action='store_true', help="also render with OpenSCAD if installed")
+    run.add_argument('--skip-csg', action='store_true', help="only the native mesh path, no solid2")
+    compare = commands.add_parser('compare', help="flag slowdowns between two reports")
+    compare.add_argument('old')
+    compare.add_argument('new')
+    compare.add_argument('--threshold', type=float, default=0.1, help="allowed slowdown, 0.1 is 10%%")
+    args = parser.parse_args()
+
+    if args.command == 'run':
+        cases = build_cases(args.iterations, args.layer_heights, args.shapes)
+        if args.filter:
+            cases = {name: c for name, c in cases.items() if args.filter in name}
+        report = run_benchmarks(cases, args.repeat, args.openscad, args.skip_csg)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print("%d cases written to %s" % (len(cases), args.output))
+    else:
+        with open(args.old) as f:
+            old = json.load(f)
+        with open(args.new) as f:
+            new = json.load(f)
+        regressions = compare_reports(old, new, args.threshold)
+        for case, metric, before, after, ratio in regressions:
+            print("%-32s %-14s %.4f s -> %.4f s (x%.2f)" % (case, metric, before, after, ratio))
+        print("%d regressions above %d%%" % (len(regressions), round(args.threshold*100)))
+        sys.exit(1 if regressions else 0)
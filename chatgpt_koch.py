@@ -1,201 +1,149 @@
 from solid2 import *
 import math
 import numpy as np
+from mesh_sweep import ring_stack, side_faces, triangulate_polygon
+from polygon_offset import offset_polygon, remove_duplicates
 
 degs60 = np.pi / 3
 cos60 = np.cos(degs60)
 sin60 = np.sin(degs60)
 
-def koch_line(start, end, factor):
-    """
-    Segments a line to Koch line, creating fractals.
+# unit vectors of the multiples of sixty degrees a bump can point to
+directions = np.stack([np.cos(np.arange(6) * degs60), np.sin(np.arange(6) * degs60)], axis=1)
 
+# factor change of the four lines a line is split into: a-b, b-c, c-d, d-e
+factor_steps = np.array([0, -1, 1, 0])
 
-    :param tuple start:  (x, y) coordinates of the starting point
-    :param tuple end: (x, y) coordinates of the end point
-    :param float factor: the multiple of sixty degrees to rotate
-    :returns tuple: tuple of all points of segmentation
-    https://nostarch.com/download/PythonPlayground_SampleChapter1.pdf
+def koch_line(segments, factor):
     """
+    Segments lines to Koch lines, creating fractals.
 
-    # coordinates of the start
-    x1, y1 = start[0], start[1]
-
-    # coordinates of the end
-    x2, y2 = end[0], end[1]
 
-    # the length of the line
-    l = np.sqrt((x2 - x1)**2 + (y2 - y1)**2)
+    :param np.ndarray segments: (n, 2, 2) start and end point of every line
+    :param np.ndarray factor: (n,) uint8 multiples of sixty degrees to rotate
+    :returns np.ndarray: (n, 5, 2) points a, b, c, d, e of every line
+    https://nostarch.com/download/PythonPlayground_SampleChapter1.pdf
+    """
+    start, end = segments[:, 0], segments[:, 1]
 
-    # first point: same as the start
-    a = (x1, y1)
+    # one third of each line
+    step = (end - start) / 3.
+    length = np.linalg.norm(step, axis=1)
 
     # second point: one third in each direction from the first point
-    b = (x1 + (x2 - x1)/3., y1 + (y2 - y1)/3.)
+    b = start + step
 
     # third point: rotation for multiple of 60 degrees
-    c = (b[0] + l/3. * np.cos(factor * np.pi/3.), b[1] + l/3. * np.sin(factor * np.pi/3.))
+    c = b + length[:, None] * directions[factor]
 
     # fourth point: two thirds in each direction from the first point
-    d = (x1 + 2. * (x2 - x1)/3., y1 + 2. * (y2 - y1)/3.)
+    d = start + 2. * step
 
-    # the last point
-    e = end
-
-    return {'a': a, 'b': b, 'c': c, 'd' : d, 'e' : e, 'factor' : factor}
+    return np.stack([start, b, c, d, end], axis=1)
 
 def koch_snowflake(degree, d=5.0):
     """Generates all lines for a Koch Snowflake with a given degree.
 
+    All lines of a level live in one contiguous array, the next level is
+    built from the points of koch_line without any Python loop over lines.
+
     :param int degree: how deep to go in the branching process
-    :param float s: the length of the initial equilateral triangle
-    :returns list: list of all lines that form the snowflake
+    :param float d: the circumradius of the initial equilateral triangle
+    :returns tuple: (n, 2, 2) float64 lines and (n,) uint8 factors
     """
-    # all lines of the snowflake
-    lines = []
-
     # vertices of the initial equilateral triangle
-    # A = (0., 0.)
-    # B = (s, 0.)
-    # C = (s * cos60, s * sin60)
     # https://math.stackexchange.com/questions/3786698/find-the-two-points-for-an-equilateral-triangle-inscribed-inside-a-circle
-    A = ( -d * sin60, -d/2)
+    A = (-d * sin60, -d/2)
     B = (d * sin60, -d/2)
     C = (0, d)
-
-
+    segments = np.array([(A, B), (B, C), (C, A)], dtype=np.float64)
 
     # set the initial lines
     if degree == 0:
-        lines.append(koch_line(A, B, 0))
-        lines.append(koch_line(B, C, 2))
-        lines.append(koch_line(C, A, 4))
+        factor = np.array([0, 2, 4], dtype=np.uint8)
     else:
-        lines.append(koch_line(A, B, 5))
-        lines.append(koch_line(B, C, 1))
-        lines.append(koch_line(C, A, 3))
+        factor = np.array([5, 1, 3], dtype=np.uint8)
 
     for i in range(1, degree):
-        # every lines produce 4 more lines
-        for _ in range(3*4**(i - 1)):
-            line = lines.pop(0)
-            factor = line['factor']
+        # every line produces 4 more lines: a to b, b to c, c to d, d to e
+        points = koch_line(segments, factor)
+        segments = np.stack([points[:, :-1], points[:, 1:]], axis=2).reshape(-1, 2, 2)
+        factor = ((factor[:, None] + factor_steps) % 6).astype(np.uint8).reshape(-1)
 
-            lines.append(koch_line(line['a'], line['b'], factor % 6))  # a to b
-            lines.append(koch_line(line['b'], line['c'], (factor - 1) % 6))  # b to c
-            lines.append(koch_line(line['c'], line['d'], (factor + 1) % 6))  # d to c
-            lines.append(koch_line(line['d'], line['e'], factor % 6))  # d to e
-
-    return lines
+    return segments, factor
 
 
 def snowflakes_lines(degree, diameter, height):
-    lines = koch_snowflake(degree=degree, d=diameter)
-    # extract the line coordinates
-    x, y, z = [], [], []
-    for l in lines:
-        x.extend([l['a'][0], l['b'][0], l['c'][0], l['d'][0], l['e'][0]])
-        y.extend([l['a'][1], l['b'][1], l['c'][1], l['d'][1], l['e'][1]])
-    z = [height] * len(x)
-
-    return [(x_, y_, z_) for x_, y_, z_ in zip(x, y, z)]
+    # Points a, b, c, d of every line; e is the next line's a
+    points = koch_line(*koch_snowflake(degree=degree, d=diameter))[:, :4].reshape(-1, 2)
+    return np.column_stack([points, np.full(len(points), float(height))])
 
 def cumsum(num_list):
     # Cumulative sum of a list
-    return [0]+[sum(num_list[:i+1]) for i in range(len(num_list))]
+    return np.concatenate([[0], np.cumsum(num_list)])
 
 def cummult(num_list):
     # Cumulative multiplication of a list
-    return [1]+[np.prod(num_list[:i+1]) for i in range(len(num_list))]
+    return np.concatenate([[1], np.cumprod(num_list)])
 
 
 def rotate_layer(layer, i):
     # Rotate the layer by i degrees
-    angle = i
-    return [(x * np.cos(np.radians(angle)) - y * np.sin(np.radians(angle)), x * np.sin(np.radians(angle)) + y * np.cos(np.radians(angle)), z) for x, y, z in layer]
+    layer = np.array(layer, dtype=np.float64)
+    layer[:, :2] = ring_stack(layer[:, :2], [i], [1], [0])[0, :, :2]
+    return layer
 
 def scale_layer(layer, scale):
     # Scale the layer by scale
-    return [(x * scale, y * scale, z) for x, y, z in layer]
+    layer = np.array(layer, dtype=np.float64)
+    layer[:, :2] *= scale
+    return layer
 
 def offset_layer(coordinates, distance):
-    coordinates = iter(coordinates)
-    x1, y1, z1 = coordinates.__next__()
-    z = distance
-    points = []
-    for x2, y2, z1 in coordinates:
-        # tangential slope approximation
-        if x1 == x2:
-            continue
-        slope = (y2 - y1) / (x2 - x1)
-        pslope = -1/slope
-        # try:
-        #     slope = (y2 - y1) / (x2 - x1)
-        #     # perpendicular slope
-        #     pslope = -1/slope  # (might be 1/slope depending on direction of travel)
-        # except ZeroDivisionError:
-        #     continue
-        mid_x = (x1 + x2) / 2
-        mid_y = (y1 + y2) / 2
-
-        sign = ((pslope > 0) == (x1 > x2)) * 2 - 1
-
-        # if z is the distance to your parallel curve,
-        # then your delta-x and delta-y calculations are:
-        #   z**2 = x**2 + y**2
-        #   y = pslope * x
-        #   z**2 = x**2 + (pslope * x)**2
-        #   z**2 = x**2 + pslope**2 * x**2
-        #   z**2 = (1 + pslope**2) * x**2
-        #   z**2 / (1 + pslope**2) = x**2
-        #   z / (1 + pslope**2)**0.5 = x
-
-        delta_x = sign * z / ((1 + pslope**2)**0.5)
-        print(pslope, delta_x)
-        delta_y = pslope * delta_x
-
-
-        points.append((mid_x + delta_x, mid_y + delta_y, z1))
-        x1, y1 = x2, y2
-    return points
+    # Parallel ring at distance (negative goes inwards), z kept
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    ring = offset_polygon(coordinates[:, :2], distance)
+    return np.column_stack([ring, np.full(len(ring), coordinates[0, 2])])
 
 
 
-def koch_snowflake_tower(depth, diameter, heigth, num_layers, height_per_layer, wall_thickness=2):
+def koch_snowflake_tower_mesh(depth, diameter, heigth, num_layers, height_per_layer, wall_thickness=2):
+    """Vertices and faces of a closed Koch snowflake tower.
 
-    print("Generating Koch Snowflake Tower...")
+    All layers are placed at once from broadcasted per-layer rotation/scale
+    matrices and the faces come from index arithmetic, so the cost does not
+    depend on Python loops over layers or points.
+
+    :returns tuple: ((num_layers+1, points, 3) float64, (F, 3) int64)
+    """
     # Generate the Koch snowflake
-    snowflake = snowflakes_lines(depth, diameter, height=heigth)
+    # degree 0 repeats corners, which the triangulation does not accept
+    snowflake = remove_duplicates(snowflakes_lines(depth, diameter, height=heigth), 1e-9*diameter)
     snowflake_points = len(snowflake)
 
-    curve_line = [0.5]*(num_layers)
-    curve_line = cumsum(curve_line)
-    scale_line = [1.00]*(num_layers)
-    scale_line = cummult(scale_line)
-    offset_line = [0]*(num_layers)
-    offset_line = cumsum(offset_line)
-
+    curve_line = cumsum([0.5]*(num_layers))
+    scale_line = cummult([1.00]*(num_layers))
 
+    z = heigth + np.arange(num_layers+1) * height_per_layer
+    vertices = ring_stack(snowflake[:, :2], curve_line, scale_line, z)
 
-    vertices, faces = [], []
-    for i in range(num_layers+1):
-        # Generate the vertices for the current layer
-        layer = [(x, y, z + i * height_per_layer) for j, (x, y, z) in enumerate(snowflake)]
-        layer = rotate_layer(layer, curve_line[i])
-        layer = scale_layer(layer, scale_line[i])
-        # layer = offset_layer(layer, offset_line[i])
-        vertices += layer
+    # walls between consecutive layers, bottom and top caps
+    cap = triangulate_polygon(snowflake)
+    faces = np.concatenate([
+        cap[:, ::-1],
+        side_faces(num_layers+1, snowflake_points),
+        cap + num_layers * snowflake_points,
+    ])
+    return vertices, faces
 
-        # Generate the faces for the current layer
-        for j in range(snowflake_points - 1):
-            faces.append([j + i * snowflake_points, j + 1 + i * snowflake_points, j + snowflake_points + i * snowflake_points])
-            faces.append([j + snowflake_points + i * snowflake_points, j + 1 + snowflake_points + i * snowflake_points, j + 1 + i * snowflake_points])
-        faces.append([snowflake_points - 1 + i * snowflake_points, i * snowflake_points, snowflake_points + i * snowflake_points])
-        faces.append([snowflake_points + i * snowflake_points, i * snowflake_points, i * snowflake_points + snowflake_points - 1])
 
+def koch_snowflake_tower(depth, diameter, heigth, num_layers, height_per_layer, wall_thickness=2):
 
+    print("Generating Koch Snowflake Tower...")
+    vertices, faces = koch_snowflake_tower_mesh(depth, diameter, heigth, num_layers, height_per_layer, wall_thickness)
 
-    return polyhedron(points=vertices, faces=faces)
+    # OpenSCAD wants faces clockwise seen from outside
+    return polyhedron(points=vertices.reshape(-1, 3).tolist(), faces=faces[:, ::-1].tolist())
 
 if __name__ == '__main__':
     depth = 2  # Set the depth of the Koch snowflake
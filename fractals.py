@@ -0,0 +1,312 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import functools
+import json
+import numpy as np
+
+from koch_outline import (convex_hull, edge_frames, koch_area, koch_hull, koch_inset, koch_inset_outline, koch_outline,
+                          koch_perimeter)
+from mesh_sweep import signed_area
+from polygon_offset import chamfer_polygon, offset_polygons
+
+# Largest outline fractal_outline builds in one array, and how many vertices
+# iter_fractal_outline expands at once
+memory_settings = {'max_bytes': 1 << 30, 'chunk_points': 1 << 20}
+
+# Relative spacing of the inset distances fractal_measure offsets by
+inset_step = 0.01
+
+
+def configure_memory(max_bytes=1 << 30, chunk_points=1 << 20):
+    memory_settings.update(max_bytes=max_bytes, chunk_points=chunk_points)
+
+
+def regular_polygon(n, start=90):
+    # Unit circumradius, counter-clockwise, first vertex at start degrees
+    a = np.radians(start + 360*np.arange(n)/n)
+    return np.stack([np.cos(a), np.sin(a)], axis=1).tolist()
+
+
+_cesaro = 1/(2 + 2*np.cos(np.radians(85)))
+
+# A fractal is a seed polygon (unit circumradius, counter-clockwise) and a
+# rule replacing every edge by steps of (direction relative to the edge in
+# degrees, length as a fraction of the edge); negative directions point out
+# of a counter-clockwise ring. symmetry is the rotation in degrees that maps
+# every level onto itself, seed_symmetry that of the seed when it differs.
+fractals = {
+    'koch': {
+        'seed': regular_polygon(3),
+        'rule': [[0, 1/3], [-60, 1/3], [60, 1/3], [0, 1/3]],
+        'symmetry': 60,
+        'seed_symmetry': 120,
+    },
+    # inward bumps on a triangle meet in its centre, a hexagon keeps them apart
+    'anti_snowflake': {
+        'seed': regular_polygon(6),
+        'rule': [[0, 1/3], [60, 1/3], [-60, 1/3], [0, 1/3]],
+        'symmetry': 60,
+    },
+    # square bumps a third of the edge wide touch at the corners from the
+    # second level on, a quarter leaves gaps
+    'quadratic_koch': {
+        'seed': regular_polygon(4, 45),
+        'rule': [[0, 3/8], [-90, 1/4], [0, 1/4], [90, 1/4], [0, 3/8]],
+        'symmetry': 90,
+    },
+    'minkowski': {
+        'seed': regular_polygon(4, 45),
+        'rule': [[0, 1/4], [-90, 1/4], [0, 1/4], [90, 1/4], [90, 1/4], [0, 1/4], [-90, 1/4], [0, 1/4]],
+        'symmetry': 90,
+    },
+    'cesaro': {
+        'seed': regular_polygon(4, 45),
+        'rule': [[0, _cesaro], [85, _cesaro], [-85, _cesaro], [0, _cesaro]],
+        'symmetry': 90,
+    },
+}
+
+
+def _key(fractal):
+    # Hashable form of a preset name or a {'seed', 'rule'} dict
+    return fractal if isinstance(fractal, str) else json.dumps(fractal, sort_keys=True)
+
+
+def _spec(key):
+    return json.loads(key) if key.startswith('{') else key
+
+
+@functools.lru_cache(maxsize=None)
+def _parse(key):
+    if not key.startswith('{'):
+        if key not in fractals:
+            raise ValueError("unknown fractal %r, presets are %s" % (key, sorted(fractals)))
+        spec = fractals[key]
+    else:
+        spec = _spec(key)
+    seed = np.array(spec['seed'], dtype=np.float64)
+    if seed.ndim != 2 or len(seed) < 3:
+        raise ValueError("a fractal seed needs at least 3 (x, y) vertices")
+    seed = seed[:, 0] + 1j*seed[:, 1]
+    if (seed.conj()*np.roll(seed, -1)).imag.sum() < 0:
+        seed = seed[::-1]
+    rule = np.array(spec['rule'], dtype=np.float64).reshape(-1, 2)
+    steps = rule[:, 1]*np.exp(1j*np.radians(rule[:, 0]))
+    if len(steps) < 2 or abs(steps.sum() - 1) > 1e-9:
+        raise ValueError("the rule steps end at %s instead of the end of the edge" % steps.sum())
+    # where the steps start, relative to an edge from 0 to 1
+    prefix = np.concatenate([[0], np.cumsum(steps)[:-1]])
+    seed.flags.writeable = prefix.flags.writeable = False
+    return seed, prefix, spec.get('symmetry', 360)
+
+
+def get_fractal(fractal='koch'):
+    """Seed and rule of a preset name or a {'seed', 'rule', 'symmetry'} dict.
+
+    :returns tuple: (complex seed ring, complex start of every rule step on
+        an edge from 0 to 1, symmetry in degrees)
+    """
+    return _parse(_key(fractal))
+
+
+def fractal_size(fractal='koch', iterations=3):
+    # Number of vertices of a fractal outline
+    seed, prefix, _ = get_fractal(fractal)
+    return len(seed)*len(prefix)**iterations
+
+
+def fractal_symmetry(fractal='koch', iterations=None):
+    # Rotation in degrees mapping the outline onto itself, at level 0 the
+    # seed's own, e.g. 120 for the snowflake's triangle
+    symmetry = get_fractal(fractal)[2]
+    if iterations == 0:
+        spec = fractals[fractal] if isinstance(fractal, str) else fractal
+        return spec.get('seed_symmetry', symmetry)
+    return symmetry
+
+
+def _expand(start, end, prefix, levels):
+    # Segments start->end replaced levels times by the rule; every segment's
+    # vertices stay contiguous, so the result is in outline order
+    for _ in range(levels):
+        points = start[:, None] + (end - start)[:, None]*prefix
+        end = np.concatenate([points[:, 1:], end[:, None]], axis=1).reshape(-1)
+        start = points.reshape(-1)
+    return start, end
+
+
+def iter_fractal_outline(fractal='koch', diameter=100, iterations=3, chunk_points=None):
+    """Vertices of fractal_outline in order, chunk by chunk.
+
+    The seed is expanded only as deep as needed for one edge to hold at
+    most chunk_points vertices at the final level; batches of those edges
+    are then expanded the remaining levels one at a time. Memory stays at a
+    few chunks whatever the level, so outlines too large for one array can
+    be streamed to a file.
+
+    :yields np.ndarray: (m, 2) float64 vertices, m at most chunk_points
+    """
+    seed, prefix, _ = get_fractal(fractal)
+    chunk_points = chunk_points or memory_settings['chunk_points']
+    k = len(prefix)
+    depth = iterations
+    while depth > 0 and k**depth > chunk_points:
+        depth -= 1
+    start = seed*(diameter/2)
+    start, end = _expand(start, np.roll(start, -1), prefix, iterations - depth)
+    batch = max(1, chunk_points//k**depth)
+    for first in range(0, len(start), batch):
+        points, _ = _expand(start[first:first + batch], end[first:first + batch], prefix, depth)
+        yield np.stack([points.real, points.imag], axis=1)
+
+
+def fractal_outline(fractal='koch', diameter=100, iterations=3, max_bytes=None):
+    """Outline of a fractal as a single counter-clockwise vertex ring.
+
+    Like koch_outline, the seed has circumradius diameter/2 and each level
+    replaces every edge p->q by the rule's steps scaled and turned onto
+    q - p, all edges of a level at once. 'koch' is koch_outline itself.
+
+    :param fractal: preset name from fractals or a {'seed', 'rule'} dict
+    :param int max_bytes: refuse outlines larger than this, defaults to
+        memory_settings['max_bytes']
+    :returns np.ndarray: (fractal_size(fractal, iterations), 2) float64 array
+    :raises ValueError: when the outline does not fit in max_bytes, use
+        iter_fractal_outline for those
+    """
+    n = fractal_size(fractal, iterations)
+    max_bytes = memory_settings['max_bytes'] if max_bytes is None else max_bytes
+    if 16*n > max_bytes:
+        raise ValueError("%s outline level %d has %d vertices, more than the %d byte budget holds"
+                         % (_key(fractal), iterations, n, max_bytes))
+    if fractal == 'koch':
+        return koch_outline(diameter, iterations)
+    points = np.empty((n, 2), dtype=np.float64)
+    i = 0
+    for chunk in iter_fractal_outline(fractal, diameter, iterations):
+        points[i:i + len(chunk)] = chunk
+        i += len(chunk)
+    return points
+
+
+def fractal_perimeter(fractal='koch', diameter=100, iterations=3):
+    if fractal == 'koch':
+        return koch_perimeter(diameter, iterations)
+    seed, prefix, _ = get_fractal(fractal)
+    steps = np.abs(np.diff(np.append(prefix, 1)))
+    return float(np.abs(np.roll(seed, -1) - seed).sum()*diameter/2*steps.sum()**iterations)
+
+
+def fractal_area(fractal='koch', diameter=100, iterations=3):
+    """Closed form of the area enclosed by fractal_outline.
+
+    Every edge e of a level adds the signed area between its rule steps and
+    itself, bump*|e|**2, and its steps' squared lengths add up to
+    r2*|e|**2. Valid as long as the outline does not cross itself.
+    """
+    if fractal == 'koch':
+        return koch_area(diameter, iterations)
+    seed, prefix, _ = get_fractal(fractal)
+    rule = np.append(prefix, 1)
+    # the steps closed back along the edge run counter-clockwise around outward bumps
+    bump = (rule.conj()*np.roll(rule, -1)).imag.sum()/2
+    r2 = np.sum(np.abs(np.diff(rule))**2)
+    s0 = np.sum(np.abs(np.roll(seed, -1) - seed)**2)
+    a0 = (seed.conj()*np.roll(seed, -1)).imag.sum()/2
+    return float((a0 + bump*s0*sum(r2**level for level in range(iterations)))*(diameter/2)**2)
+
+
+def fractal_inset(fractal='koch', diameter=100, iterations=3, distance=0):
+    """Area and perimeter of the outline offset inwards by distance (miter).
+
+    koch_inset's closed form for 'koch', otherwise measured on the largest
+    offset ring, the one a lamp wall follows. The offset of a deep outline
+    takes seconds, so measurements are cached per outline and distance.
+
+    :returns tuple: (area, perimeter), zero when nothing is left
+    """
+    if fractal == 'koch':
+        return koch_inset(diameter, iterations, distance)
+    return _inset(_key(fractal), float(diameter), iterations, float(distance))
+
+
+@functools.lru_cache(maxsize=256)
+def _inset(key, diameter, iterations, distance):
+    rings = offset_polygons(fractal_outline(_spec(key), diameter, iterations), -distance)
+    if not rings:
+        return 0.0, 0.0
+    edge = np.roll(rings[0], -1, axis=0) - rings[0]
+    return float(signed_area(rings[0])), float(np.hypot(edge[:, 0], edge[:, 1]).sum())
+
+
+def fractal_measure(fractal='koch', diameter=100, iterations=3, chamfer=0, distance=0, fn=72):
+    """Area, perimeter and edge_frames of a lamp ring.
+
+    The ring is the outline chamfered by chamfer, then offset inwards by
+    distance (miter, round once chamfered) like the creator's inner wall.
+    It is measured at radius 1 and scaled, so every diameter shares one
+    chamfer and offset per ratio. The unchamfered Koch inset is exact
+    (koch_inset_outline). Other insets cost a full offset of the outline,
+    so they are taken at distances inset_step apart and interpolated, which
+    keeps a sweep over scales and wall thicknesses in the cache.
+
+    :returns tuple: (area, perimeter, (length, start, end)), zero and
+        empty when nothing is left
+    """
+    radius = diameter/2
+    key, chamfer, distance = _key(fractal), chamfer/radius, distance/radius
+    if distance <= 0 or (key == 'koch' and chamfer <= 0):
+        area, perimeter, frames = _measure(key, iterations, chamfer, max(distance, 0), fn)
+    else:
+        k = int(np.floor(np.log(distance)/np.log1p(inset_step)))
+        below, above = (_measure(key, iterations, chamfer, (1 + inset_step)**i, fn) for i in (k, k + 1))
+        t = (distance/(1 + inset_step)**k - 1)/inset_step
+        area, perimeter = ((1 - t)*a + t*b for a, b in zip(below[:2], above[:2]))
+        # both rings' edges, weighted like the measurements
+        frames = [np.concatenate([(1 - t)*below[2][0], t*above[2][0]])]
+        frames += [np.concatenate([a, b]) for a, b in zip(below[2][1:], above[2][1:])]
+    length, start, end = frames
+    return area*radius**2, perimeter*radius, (length*radius, start*radius, end*radius)
+
+
+@functools.lru_cache(maxsize=64)
+def _chamfered(key, iterations, chamfer, fn):
+    outline = fractal_outline(_spec(key), 2, iterations)
+    if chamfer > 0:
+        outline = chamfer_polygon(outline, chamfer, fn=fn)
+    outline.flags.writeable = False
+    return outline
+
+
+@functools.lru_cache(maxsize=256)
+def _measure(key, iterations, chamfer, distance, fn):
+    ring = _chamfered(key, iterations, chamfer, fn)
+    if distance > 0 and key == 'koch' and chamfer <= 0:
+        ring = koch_inset_outline(2, iterations, distance)
+    elif distance > 0:
+        rings = offset_polygons(ring, -distance, 'round' if chamfer > 0 else 'miter', fn)
+        ring = rings[0] if rings else None
+    if ring is None:
+        return 0.0, 0.0, (np.zeros(0), np.zeros(0, complex), np.zeros(0, complex))
+    edge = np.roll(ring, -1, axis=0) - ring
+    frames = edge_frames(ring)
+    for array in frames:
+        array.flags.writeable = False
+    return float(signed_area(ring)), float(np.hypot(edge[:, 0], edge[:, 1]).sum()), frames
+
+
+def fractal_hull(fractal='koch', iterations=3, chamfer=0, fn=72):
+    # Complex convex hull vertices of the outline at radius 1, chamfered by
+    # chamfer radii
+    if fractal == 'koch' and chamfer <= 0:
+        return koch_hull(iterations)
+    return _hull(_key(fractal), iterations, float(chamfer), fn)
+
+
+@functools.lru_cache(maxsize=None)
+def _hull(key, iterations, chamfer, fn):
+    hull = convex_hull(_chamfered(key, iterations, chamfer, fn))
+    hull = hull[:, 0] + 1j*hull[:, 1]
+    hull.flags.writeable = False
+    return hull
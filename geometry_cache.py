@@ -0,0 +1,169 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import numbers
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+
+from kochLamp_layered import KochSnowflake_creator, default_config
+
+# Bump whenever a change to the generator alters its output
+GENERATOR_VERSION = '3'
+
+
+def normalize_config(config_dict):
+    # Defaults filled in and every number as float, so 2 and 2.0 hash alike
+    def normalize(value):
+        if isinstance(value, bool) or value is None or isinstance(value, str):
+            return value
+        if isinstance(value, numbers.Real):
+            return float(value)
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+    merged = dict(default_config)
+    merged.update(config_dict)
+    # the default outline, configs from before fractals keep their keys
+    if merged.get('fractal') == 'koch':
+        del merged['fractal']
+    return normalize(merged)
+
+
+def config_key(config_dict):
+    payload = json.dumps({'version': GENERATOR_VERSION, 'config': normalize_config(config_dict)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class GeometryCache:
+    """Content-addressed store of generated lamps.
+
+    Entries are keyed by the normalized config plus GENERATOR_VERSION and
+    hold the outline, the swept mesh and the exported STL/SCAD files. A
+    small in-memory LRU sits in front of a directory whose total size is
+    kept under max_bytes by dropping the least recently used entries.
+    """
+
+    arrays_name = 'arrays.npz'
+    stamp_name = 'last_used'
+
+    def __init__(self, directory='geometry_cache', max_bytes=2**30, memory_entries=16):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, name=''):
+        return os.path.join(self.directory, key, name)
+
+    def _touch(self, key):
+        if os.path.isdir(self._path(key)):
+            with open(self._path(key, self.stamp_name), 'w'):
+                pass
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        # Entry dict (arrays plus file paths) or None on a miss
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self._touch(key)
+            return self._memory[key]
+        if not os.path.exists(self._path(key, self.arrays_name)):
+            return None
+        with np.load(self._path(key, self.arrays_name)) as data:
+            entry = {name: data[name] for name in data.files}
+        entry['files'] = {name.split('.')[-1]: self._path(key, name)
+                          for name in os.listdir(self._path(key)) if name.startswith('model.')}
+        self._touch(key)
+        self._remember(key, entry)
+        return entry
+
+    def put(self, key, arrays, files=None):
+        """Stores arrays and copies of the given files under key.
+
+        :param dict arrays: name -> np.ndarray, e.g. outline, vertices, faces
+        :param dict files: extension -> path of an exported file
+        """
+        tmp = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        np.savez(os.path.join(tmp, self.arrays_name), **arrays)
+        for ext, path in (files or {}).items():
+            shutil.copyfile(path, os.path.join(tmp, 'model.' + ext))
+        try:
+            os.rename(tmp, self._path(key))
+        except OSError:
+            # another worker stored the same key first
+            shutil.rmtree(tmp, ignore_errors=True)
+        self._touch(key)
+        self._memory.pop(key, None)
+        self.evict(keep=key)
+        return self.get(key)
+
+    def evict(self, keep=None):
+        entries = []
+        total = 0
+        for key in os.listdir(self.directory):
+            if key.startswith('.') or key == keep:
+                continue
+            path = self._path(key)
+            stamp = self._path(key, self.stamp_name)
+            try:
+                size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+                used = os.path.getmtime(stamp) if os.path.exists(stamp) else 0
+            except FileNotFoundError:
+                # another worker sharing the directory removed it meanwhile
+                continue
+            entries.append((used, key, size))
+            total += size
+        for used, key, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            self._memory.pop(key, None)
+            total -= size
+
+    def get_or_create(self, config_dict, scad=False):
+        """Cached lamp for config_dict, generated and stored on a miss.
+
+        A hit returns without building the fractal, the mesh or any file.
+        """
+        key = config_key(config_dict)
+        entry = self.get(key)
+        if entry is not None and (not scad or 'scad' in entry['files']):
+            return entry
+        creator = KochSnowflake_creator(config_dict)
+        vertices, faces = creator.create_mesh()
+        outline = creator.get_sweep_inputs()[0]
+        work = tempfile.mkdtemp(dir=self.directory, prefix='.tmp-')
+        try:
+            files = {'stl': os.path.join(work, 'model.stl')}
+            creator.save_as_stl(files['stl'])
+            if scad:
+                files['scad'] = os.path.join(work, 'model.scad')
+                # written straight from the arrays, only csg_outline needs the tree
+                if creator.csg_outline:
+                    creator.create()
+                creator.save_as_scad(files['scad'])
+            if entry is not None:
+                shutil.rmtree(self._path(key), ignore_errors=True)
+            return self.put(key, {'outline': outline, 'vertices': vertices, 'faces': faces}, files)
+        finally:
+            shutil.rmtree(work, ignore_errors=True)
+
+    def export(self, config_dict, filename, kind='stl'):
+        # Copies the cached STL/SCAD of config_dict to filename
+        entry = self.get_or_create(config_dict, scad=(kind == 'scad'))
+        shutil.copyfile(entry['files'][kind], filename)
+        return filename
@@ -0,0 +1,215 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import itertools
+import struct
+import numpy as np
+
+from stl_writer import STL_FACET, save_mesh_stl
+
+# Compact format: magic, version, vertex count, face count, then the raw
+# little-endian float32 vertices and uint32 faces
+MESH_MAGIC = b'KMSH'
+MESH_HEADER = struct.Struct('<4sIII')
+
+_cell_dtype = np.dtype([('x', '<i8'), ('y', '<i8'), ('z', '<i8')])
+
+# Half of the 26 neighbour cells, every neighbouring pair is visited once
+_neighbours = [o for o in itertools.product((-1, 0, 1), repeat=3) if o > (0, 0, 0)]
+
+
+def _components(n, pairs):
+    # Smallest member of the connected component of every node 0..n-1
+    label = np.arange(n)
+    if not len(pairs):
+        return label
+    a, b = pairs[:, 0], pairs[:, 1]
+    while True:
+        low = np.minimum(label[a], label[b])
+        before = label.copy()
+        np.minimum.at(label, a, low)
+        np.minimum.at(label, b, low)
+        # pointer jumping, labels always point to a smaller or equal node
+        label = label[label]
+        if np.array_equal(label, before):
+            return label
+
+
+def _unique_rows(rows):
+    # Sorted distinct rows, first occurrence of each and row -> distinct index
+    order = np.lexsort(rows.T[::-1])
+    ordered = rows[order]
+    new = np.ones(len(rows), dtype=bool)
+    new[1:] = np.any(ordered[1:] != ordered[:-1], axis=1)
+    inverse = np.empty(len(rows), dtype=np.int64)
+    inverse[order] = np.cumsum(new) - 1
+    return ordered[new], order[new], inverse
+
+
+def weld_vertices(vertices, tolerance=0):
+    """Merges vertices that lie within tolerance of each other.
+
+    Vertices are binned on a hash grid of cell size tolerance and every
+    vertex is compared with the vertices of its own and the neighbouring
+    cells, so exactly the pairs within tolerance are linked; chains of such
+    pairs collapse into one vertex. tolerance 0 merges exact duplicates
+    only. Every merged group keeps the coordinates of its first vertex.
+
+    :param np.ndarray vertices: (n, 3) coordinates
+    :returns tuple: (kept vertex indices, (n,) new index of every vertex)
+    """
+    vertices = np.asarray(vertices)
+    if tolerance > 0:
+        cells = np.floor(vertices/tolerance).astype(np.int64)
+    else:
+        # + 0.0 turns -0.0 into 0.0, which has other bits
+        cells = np.ascontiguousarray(vertices + 0.0, dtype=np.float64).view(np.int64)
+    unique, first, cell_of = _unique_rows(cells)
+    # first (smallest) vertex of every vertex's group
+    label = first[cell_of]
+    if tolerance > 0 and len(unique):
+        # cells as one integer when the grid fits, neighbours are then a
+        # constant key offset away; sorted rows otherwise
+        low = unique.min(axis=0) - 1
+        span = unique.max(axis=0) - low + 2
+        packed = float(np.prod(span.astype(np.float64))) < 2.0**62
+        if packed:
+            weights = np.array([span[1]*span[2], span[2], 1])
+            keys = (unique - low) @ weights
+        else:
+            keys = np.ascontiguousarray(unique).view(_cell_dtype).reshape(-1)
+        # the vertices of cell c are members[start[c]:start[c] + count[c]]
+        members = np.argsort(cell_of, kind='stable')
+        count = np.bincount(cell_of, minlength=len(unique))
+        start = np.cumsum(count) - count
+        pairs = []
+        for offset in [(0, 0, 0)] + _neighbours:
+            if offset == (0, 0, 0):
+                i = j = np.arange(len(unique))
+            else:
+                if packed:
+                    query = keys + np.dot(offset, weights)
+                else:
+                    query = np.ascontiguousarray(unique + offset).view(_cell_dtype).reshape(-1)
+                j = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+                i = np.flatnonzero(keys[j] == query)
+                j = j[i]
+            # every vertex of cell i against every vertex of cell j
+            n = count[i]*count[j]
+            cell = np.repeat(np.arange(len(i)), n)
+            k = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            a = members[start[i][cell] + k//count[j][cell]]
+            b = members[start[j][cell] + k % count[j][cell]]
+            if offset == (0, 0, 0):
+                a, b = a[a < b], b[a < b]
+            close = np.linalg.norm(vertices[a] - vertices[b], axis=1) <= tolerance
+            pairs.append(np.stack([a[close], b[close]], axis=1))
+        label = _components(len(vertices), np.concatenate(pairs))
+    # groups numbered by their first vertex, so the input order is kept
+    kept = np.unique(label)
+    return kept, np.searchsorted(kept, label)
+
+
+class IndexedMesh:
+    """Triangle mesh stored as float32 vertices and uint32 faces.
+
+    Unpacks like the (vertices, faces) tuples of the mesh functions, so
+    `save_mesh_stl(filename, *mesh)` works unchanged.
+
+    :param vertices: (V, 3) coordinates
+    :param faces: (F, 3) vertex indices, counter-clockwise seen from outside
+    """
+
+    __slots__ = ('vertices', 'faces')
+
+    def __init__(self, vertices, faces):
+        self.vertices = np.ascontiguousarray(np.asarray(vertices, dtype=np.float32).reshape(-1, 3))
+        self.faces = np.ascontiguousarray(np.asarray(faces, dtype=np.uint32).reshape(-1, 3))
+
+    def __iter__(self):
+        return iter((self.vertices, self.faces))
+
+    def __repr__(self):
+        return 'IndexedMesh(%d vertices, %d faces)' % (len(self.vertices), len(self.faces))
+
+    @property
+    def nbytes(self):
+        return self.vertices.nbytes + self.faces.nbytes
+
+    @classmethod
+    def from_triangles(cls, triangles, tolerance=0):
+        # Triangle soup, e.g. from iter_sweep_triangles, welded into a mesh
+        triangles = np.asarray(triangles, dtype=np.float32).reshape(-1, 3)
+        return cls(triangles, np.arange(len(triangles)).reshape(-1, 3)).weld(tolerance)
+
+    def weld(self, tolerance=0):
+        """Mesh with vertices within tolerance merged.
+
+        Faces that lose a corner to the merge are dropped, unused vertices
+        disappear.
+        """
+        kept, index = weld_vertices(self.vertices, tolerance)
+        faces = index[self.faces]
+        good = (faces[:, 0] != faces[:, 1]) & (faces[:, 1] != faces[:, 2]) & (faces[:, 2] != faces[:, 0])
+        return IndexedMesh(self.vertices[kept], faces[good])
+
+    def save_stl(self, filename, binary=True):
+        # STL stores float32 corners, so nothing is lost on the way
+        return save_mesh_stl(filename, self.vertices, self.faces, binary=binary)
+
+    def save_ply(self, filename):
+        header = ('ply\nformat binary_little_endian 1.0\n'
+                  'element vertex %d\nproperty float x\nproperty float y\nproperty float z\n'
+                  'element face %d\nproperty list uchar uint vertex_indices\nend_header\n'
+                  % (len(self.vertices), len(self.faces)))
+        rows = np.empty(len(self.faces), dtype=[('n', 'u1'), ('index', '<u4', (3,))])
+        rows['n'] = 3
+        rows['index'] = self.faces
+        with open(filename, 'wb') as f:
+            f.write(header.encode('ascii'))
+            f.write(self.vertices.astype('<f4').tobytes())
+            f.write(rows.tobytes())
+        return filename
+
+    def save(self, filename):
+        # Compact binary format, read back by IndexedMesh.load
+        with open(filename, 'wb') as f:
+            f.write(MESH_HEADER.pack(MESH_MAGIC, 1, len(self.vertices), len(self.faces)))
+            f.write(self.vertices.astype('<f4').tobytes())
+            f.write(self.faces.astype('<u4').tobytes())
+        return filename
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename, 'rb') as f:
+            magic, version, n_vertices, n_faces = MESH_HEADER.unpack(f.read(MESH_HEADER.size))
+            if magic != MESH_MAGIC or version != 1:
+                raise ValueError("%s is not a version 1 compact mesh" % filename)
+            vertices = np.fromfile(f, dtype='<f4', count=3*n_vertices)
+            faces = np.fromfile(f, dtype='<u4', count=3*n_faces)
+        return cls(vertices, faces)
+
+    @classmethod
+    def load_ply(cls, filename):
+        # Only the binary layout written by save_ply
+        with open(filename, 'rb') as f:
+            header = []
+            while not header or header[-1] != 'end_header':
+                header.append(f.readline().decode('ascii').strip())
+            counts = {line.split()[1]: int(line.split()[2]) for line in header if line.startswith('element')}
+            if 'format binary_little_endian 1.0' not in header:
+                raise ValueError("%s is not a binary little endian PLY file" % filename)
+            vertices = np.fromfile(f, dtype='<f4', count=3*counts['vertex'])
+            rows = np.fromfile(f, dtype=[('n', 'u1'), ('index', '<u4', (3,))], count=counts['face'])
+        if np.any(rows['n'] != 3):
+            raise ValueError("%s has faces that are not triangles" % filename)
+        return cls(vertices, rows['index'])
+
+    @classmethod
+    def load_stl(cls, filename):
+        # Binary STL, corners shared between facets welded back exactly
+        with open(filename, 'rb') as f:
+            f.seek(80)
+            count, = struct.unpack('<I', f.read(4))
+            facets = np.fromfile(f, dtype=STL_FACET, count=count)
+        return cls.from_triangles(facets['vertices'])
@@ -0,0 +1,100 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+# Shared stand-in for stage() while instrumentation is off, costs one call
+no_stage = contextlib.nullcontext()
+
+
+class Instrumentation:
+    """Opt-in stage timings, peak memory and counters.
+
+    Stages nest; every finished stage becomes a record dict with its path
+    (e.g. 'create/layers/offsets'), wall seconds, the tracemalloc peak above
+    the memory in use when it started and the counters set inside it. Each
+    record is passed to the hooks as soon as the stage ends.
+
+    :param bool memory: track peak memory with tracemalloc, which slows
+        allocation-heavy code down noticeably
+    :param list hooks: callables taking one record, e.g. a metrics sink
+    """
+
+    def __init__(self, memory=True, hooks=None):
+        self.memory = memory
+        self.hooks = list(hooks or [])
+        self.records = []
+        self._stack = []
+        self._started_tracing = False
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+        return hook
+
+    def count(self, name, value):
+        # Sets a counter on the innermost open stage
+        if self._stack:
+            self._stack[-1]['counts'][name] = value
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        parent = self._stack[-1] if self._stack else None
+        record = {
+            'stage': name,
+            'path': parent['path'] + '/' + name if parent else name,
+            'counts': {},
+        }
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if parent is not None:
+                parent['_peak'] = max(parent['_peak'], peak)
+            tracemalloc.reset_peak()
+            record['_start'], record['_peak'] = current, current
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._stack.pop()
+            if self.memory:
+                peak = max(record.pop('_peak'), tracemalloc.get_traced_memory()[1])
+                record['peak_bytes'] = peak - record.pop('_start')
+                if parent is not None:
+                    parent['_peak'] = max(parent['_peak'], peak)
+                if not self._stack and self._started_tracing:
+                    tracemalloc.stop()
+                    self._started_tracing = False
+            self.records.append(record)
+            for hook in self.hooks:
+                hook(record)
+
+    def summary(self):
+        # Seconds, worst peak and last counters per stage path
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['path'], {'calls': 0, 'seconds': 0.0})
+            total['calls'] += 1
+            total['seconds'] += record['seconds']
+            if 'peak_bytes' in record:
+                total['peak_bytes'] = max(total.get('peak_bytes', 0), record['peak_bytes'])
+            total.update(record['counts'])
+        return totals
+
+    def report(self):
+        lines = []
+        for path, total in self.summary().items():
+            extra = ''.join(', %s=%s' % item for item in total.items() if item[0] not in ('calls', 'seconds'))
+            lines.append('%-32s %8.3f s x%d%s' % (path, total['seconds'], total['calls'], extra))
+        return '\n'.join(lines)
+
+    def save_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump({'records': self.records, 'summary': self.summary()}, f, indent=4)
+        return filename
@@ -6,9 +6,18 @@ import math
 
 # Assumes SolidPython is in site-packages
 from solid2 import *
+from fractals import fractal_outline
+from mesh_sweep import extrude_rings, interpolate_ring, sweep_mesh
+from stl_writer import save_mesh_stl
+import numpy as np
 # from solid2.utils import *
 
-def kochSnowflake(diameter=100, iterations=3):
+def kochSnowflake(diameter=100, iterations=3, csg=False, fractal='koch'):
+    # Single polygon computed directly, csg=True keeps the nested union tree
+    if not csg:
+        return polygon(fractal_outline(fractal, diameter, iterations).tolist())
+    if fractal != 'koch':
+        raise ValueError("only the Koch snowflake has a CSG construction")
     rad = diameter/2
     xrad = rad*math.sqrt(3)/2
     yrad = rad/2
@@ -29,6 +38,38 @@ def kochSnowflake(diameter=100, iterations=3):
         koch.append(shape)
     return koch[-1]
 
+def kochLamp_mesh(
+        diameter=150,
+        height=150,
+        base_diameter=100,
+        twist=90,
+        base_slices=200,
+        koch_iterations=3,
+        fractal='koch',
+        ):
+    """Triangle mesh of kochLamp() swept directly, without CSG booleans.
+
+    The outer wall follows the twisted extrusion ring by ring, the inner
+    wall is the same sweep of the 0.7-scaled snowflake and the cylinder cut
+    becomes a last ring interpolated at height-5, so the result is a tube
+    with band shaped rims at the bottom and at the cut.
+
+    :returns tuple: (vertices (V, 3) float64, faces (F, 3) int64)
+    """
+    cut = height - 5
+    if cut <= 0:
+        raise ValueError("height %g leaves nothing below the 5 mm top cut" % height)
+    outline = fractal_outline(fractal, diameter, koch_iterations)
+    angles, scales, z = extrude_rings(height, twist, diameter/base_diameter, base_slices)
+    k = int(np.searchsorted(z, cut))
+    if z[k] > cut:
+        t = (cut - z[k-1])/(z[k] - z[k-1])
+        angle, ring_scale = interpolate_ring(angles[k-1], scales[k-1], angles[k], scales[k], t)
+        angles, scales, z = (np.append(a[:k], v) for a, v in ((angles, angle), (scales, ring_scale), (z, cut)))
+    else:
+        angles, scales, z = angles[:k+1], scales[:k+1], z[:k+1]
+    return sweep_mesh(outline, angles, scales, z, inner=0.7*outline, hollow_from=0)
+
 def kochLamp(
         diameter=150,        # Diameter of tree at widest point
         height=150,         # Total height of tree
@@ -36,9 +77,13 @@ def kochLamp(
         twist=90,       # Twist of tree base
         base_slices=200,      # Slices of base extrusion
         koch_iterations=3,  # iterations of Koch Snowflake
+        csg=False,          # solid2 object instead of a (vertices, faces) mesh
+        fractal='koch',     # outline preset or {'seed', 'rule'} of fractals.py
         ):
+    if not csg:
+        return kochLamp_mesh(diameter, height, base_diameter, twist, base_slices, koch_iterations, fractal)
 
-    snowflake = kochSnowflake(diameter=diameter, iterations=koch_iterations)
+    snowflake = kochSnowflake(diameter=diameter, iterations=koch_iterations, fractal=fractal)
     body = linear_extrude(
                 height=height,
                 scale=diameter/base_diameter,
@@ -69,7 +114,6 @@ def kochLamp(
 
 if __name__ == '__main__':
     fractalLamp = kochLamp()
-    # print(scad_render(fractalChrismasTree))
 
-    # save your model for use in OpenSCAD
-    fractalLamp.save_as_scad()
+    # save your model, kochLamp(csg=True).save_as_scad() for use in OpenSCAD
+    save_mesh_stl('kochLamp.stl', *fractalLamp)
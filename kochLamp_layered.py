@@ -5,24 +5,93 @@ from __future__ import division
 import math
 import json
 from solid2 import *
+from koch_outline import koch_outline
+from fractals import fractal_hull, fractal_measure, fractal_outline
+from profiles import adaptive_boundaries, evaluate_profile, layer_transforms
+from mesh_sweep import iter_sweep_triangles, signed_area, sweep_mesh, sweep_mesh_parallel
+from mesh_validation import validate_mesh, validate_sweep
+from polygon_offset import chamfer_polygon, offset_polygon
+from indexed_mesh import IndexedMesh
+from instrumentation import no_stage
+from scad_export import count_nodes, open_scad, save_scad
+from stl_writer import save_mesh_stl, write_stl
+from vase_gcode import default_settings as print_settings, write_vase_gcode
 import numpy as np
 import os
 from subprocess import run
 
 # Load the configuration from a JSON file
-with open('config.json', 'r') as f:
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'), 'r') as f:
     config = json.load(f)
 
+default_config = {"height": 100, "base_diameter": 50, "koch_iterations": 3, "wall_thickness": 0.4, "height_per_layer": 2, "chamfer_r": 0}
+
+
+def _freeze(value):
+    # Cached arrays are shared between calls, so nobody may edit them
+    for array in value if isinstance(value, tuple) else (value,):
+        if isinstance(array, np.ndarray):
+            array.flags.writeable = False
+    return value
+
 
 class KochSnowflake_creator:
-    def __init__(self, config_dict=None):
+    # Derived artifact -> (config attributes, artifacts) it is computed from
+    dependencies = {
+        'outline': (('fractal', 'base_diameter', 'koch_iterations'), ()),
+        'chamfered': (('chamfer_r', '_fn'), ('outline',)),
+        'boundaries': (('height', 'height_per_layer', 'wall_thickness', 'adaptive_tolerance',
+                        'base_diameter', 'twists_list', 'scaling_list'), ()),
+        'transforms': (('height', 'height_per_layer', 'base_diameter', 'twists_list', 'scaling_list'), ('boundaries',)),
+        # only the scale where the cavity starts, so a new twist keeps it
+        'inner': (('wall_thickness', 'chamfer_r', '_fn', '_inner_scale'), ('chamfered',)),
+        'mesh': ((), ('chamfered', 'transforms', 'inner')),
+        'body': (('csg_outline', 'fractal', 'base_diameter', 'koch_iterations', 'chamfer_r', 'wall_thickness'),
+                 ('chamfered', 'transforms', 'inner')),
+    }
+
+    def __init__(self, config_dict=None, instrumentation=None):
         self.chamfer_r = 0
         self.body = None
+        self.mesh = None
+        self._artifacts = {}
+        # instrumentation.Instrumentation collecting stage timings, or None
+        self.instrumentation = instrumentation
         self.set_config(config_dict)
 
+    def _stage(self, name):
+        if self.instrumentation is None:
+            return no_stage
+        return self.instrumentation.stage(name)
+
+    def _artifact_key(self, name):
+        fields, parents = self.dependencies[name]
+        values = json.dumps([getattr(self, field) for field in fields], sort_keys=True, default=repr)
+        return (values,) + tuple(self._artifact_key(parent) for parent in parents)
+
+    def _artifact(self, name, compute):
+        # Value of a derived artifact, recomputed only when one of its config
+        # attributes or upstream artifacts changed since the last call
+        key = self._artifact_key(name)
+        cached = self._artifacts.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        value = _freeze(compute())
+        self._artifacts[name] = (key, value)
+        return value
+
+    def invalidate(self, *names):
+        # Drops the given cached artifacts, or all of them
+        for name in names or list(self._artifacts):
+            self._artifacts.pop(name, None)
+
+    def _count(self, name, value):
+        if self.instrumentation is not None:
+            self.instrumentation.count(name, value() if callable(value) else value)
+
     def set_config(self, config_dict=None):
         if config_dict is None:
-            config_dict = {"height": 100, "base_diameter": 50, "koch_iterations": 3, "wall_thickness": 0.4, "height_per_layer": 2, "chamfer_r": 0}
+            config_dict = default_config
         self.height = config_dict['height']
         self.base_diameter = config_dict['base_diameter']
         self.koch_iterations = config_dict['koch_iterations']
@@ -35,10 +104,23 @@ class KochSnowflake_creator:
         self.scaling_list = []
         if "scaling_list" in config_dict:
             self.scaling_list = config_dict['scaling_list']
-        self.num_layers = int(self.height/self.height_per_layer)
-        self.floor_layer = int(self.wall_thickness/self.height_per_layer)
+        self.csg_outline = config_dict.get('csg_outline', False)
+        # preset name or {'seed', 'rule'} dict of fractals.py
+        self.fractal = config_dict.get('fractal', 'koch')
+        # chordal error in mm, 0 keeps every height_per_layer boundary
+        self.adaptive_tolerance = config_dict.get('adaptive_tolerance', 0)
         self._fn = 72
 
+    # Derived from their inputs on every read, so an attribute set directly
+    # reaches the artifacts keyed on height, height_per_layer and wall_thickness
+    @property
+    def num_layers(self):
+        return int(self.height/self.height_per_layer)
+
+    @property
+    def floor_layer(self):
+        return int(self.wall_thickness/self.height_per_layer)
+
     def switch_config(self, config_name):
         self.set_config(config[config_name])
 
@@ -51,60 +133,172 @@ class KochSnowflake_creator:
             "height_per_layer": self.height_per_layer,
             "chamfer_r": self.chamfer_r,
             "twists_list": self.twists_list,
-            "scaling_list": self.scaling_list
+            "scaling_list": self.scaling_list,
+            "adaptive_tolerance": self.adaptive_tolerance,
+            "fractal": self.fractal
         }
         with open(filename, 'a') as f:
             json.dump(current_config, f)
 
-    def save_as_scad(self, filename=None):
+    def save_as_scad(self, filename=None, modules=True, direct=True):
+        if direct and filename is not None and not self.csg_outline:
+            # Written straight from the outline arrays, create() is not needed
+            with self._stage('save_as_scad'):
+                self.write_scad(filename)
+                self._count('scad_bytes', lambda: os.path.getsize(filename))
+            return
         if self.body is None:
             print("No object to save")
             return
-        if filename is None:
-            self.body.save_as_scad(filename)
-        else:
-            scad_render_to_file(self.body, filename)
+        with self._stage('save_as_scad'):
+            if filename is None:
+                self.body.save_as_scad(filename)
+                return
+            if modules:
+                # Repeated sub-trees are written once as modules
+                save_scad(self.body, filename)
+            else:
+                scad_render_to_file(self.body, filename)
+            self._count('scad_bytes', lambda: os.path.getsize(filename))
 
-    def save_as_stl(self, filename=None):
-        if self.body is None:
+    def save_as_stl(self, filename=None, binary=True):
+        if filename is None:
+            print("No filename provided")
+            return
+        if self.csg_outline and self.body is None:
             print("No object to save")
             return
-        if filename is not None:
-            if not os.path.exists(filename):
-                with open(filename, 'w') as f:
-                    f.write('')
-            self.body.save_as_stl(filename)
+        with self._stage('save_as_stl'):
+            if not self.csg_outline:
+                # Native writer, no OpenSCAD process involved; the mesh is
+                # swept here when only create() was called
+                save_mesh_stl(filename, *self.create_mesh(), binary=binary)
+            else:
+                if not os.path.exists(filename):
+                    with open(filename, 'w') as f:
+                        f.write('')
+                self.body.save_as_stl(filename)
+            self._count('stl_bytes', lambda: os.path.getsize(filename))
+
+    def stream_stl(self, filename, binary=True, rings_per_chunk=64):
+        # Writes the swept lamp layer chunk by layer chunk, without create_mesh()
+        triangles = iter_sweep_triangles(*self.get_sweep_inputs(), rings_per_chunk=rings_per_chunk)
+        return write_stl(filename, triangles, binary=binary)
+
+    def save_as_gcode(self, filename, **settings):
+        """Spiral vase G-code of the lamp, no STL or slicer involved.
+
+        The floor below the hollow part is printed solid, the wall above it
+        as one continuous spiral; see vase_gcode.write_vase_gcode for the
+        settings.
+
+        :returns dict: moves, filament_mm and estimated seconds
+        """
+        outline, angles, scales, z, _, hollow_from = self.get_sweep_inputs()
+        with self._stage('save_as_gcode'):
+            stats = write_vase_gcode(filename, outline, angles, scales, z,
+                                     floor_height=z[min(hollow_from, len(z)-1)], **settings)
+            self._count('gcode_moves', stats['moves'])
+        return stats
+
+    def get_metrics(self, **settings):
+        """Print metrics from the profile alone, no mesh or file.
+
+        Between two rings the cut at a fraction t is the outline under
+        w = (1-t)*w0 + t*w1 (w = scale*exp(i*angle)), so a slab of height h
+        holds exactly A*h*(|w0|**2 + Re(w0*conj(w1)) + |w1|**2)/3. The walls
+        are the mesh's own triangles, summed over the distinct edge_frames
+        of each ring. Rings come from fractal_measure at radius 1, cached
+        per fractal, level and chamfer: the first chamfered or non-Koch lamp
+        pays a chamfer and two offsets (up to a second for deep outlines),
+        the variants after it milliseconds. Those inner walls are
+        interpolated between offsets 1% apart; surface_area stays within
+        about 0.5% of the mesh.
+
+        :param settings: vase_gcode settings used for the print estimate
+        :returns dict: volume (mm3), surface_area (mm2), bounding_box,
+            per-layer overhang_deg of the outermost tips, filament_mm and
+            print_seconds
+        """
+        settings = dict(print_settings, **settings)
+        width = settings['extrusion_width'] or 1.125*settings['nozzle_diameter']
+        z = self.layer_boundaries()
+        rota_list, scaling = self.get_layer_transforms()
+        w = np.concatenate([[1], np.cumprod(scaling)])*np.exp(1j*np.radians(np.concatenate([[0], np.cumsum(rota_list)])))
+        hollow_from = self.get_hollow_from(z)
+        h, w0, w1 = np.diff(z), w[:-1], w[1:]
+        slab = h*(abs(w0)**2 + (w0*w1.conj()).real + abs(w1)**2)/3
+        shift = abs(w1 - w0)
+        # moves between the rings, each in the frame of the ring it starts from
+        c0 = (w1 - w0)*np.exp(-1j*np.angle(w0))
+        c1 = (w0 - w1)*np.exp(-1j*np.angle(w1))
+        hollow = hollow_from < len(z)-1
+        area, _, frames = fractal_measure(self.fractal, self.base_diameter, self.koch_iterations,
+                                          self.chamfer_r, fn=self._fn)
+        inner_area, inner_frames = 0.0, None
+        if hollow:
+            inner_area, _, inner_frames = fractal_measure(self.fractal, self.base_diameter, self.koch_iterations,
+                                                          self.chamfer_r, self.wall_thickness/abs(w[hollow_from]),
+                                                          self._fn)
+        floor = area*slab[:hollow_from].sum()
+        wall = (area - inner_area)*slab[hollow_from:].sum()
+
+        def walls(frames, k):
+            # edge p->q of ring w0 and of ring w1 span two triangles; each has
+            # that edge as base and is tilted by the sideways move of q from
+            # w0, or of p from w1, as seen from the edge
+            length, start, end = frames
+            side = abs(w0[k:, None])*np.sqrt(h[k:, None]**2 + (c0[k:, None]*end).imag**2)
+            side += abs(w1[k:, None])*np.sqrt(h[k:, None]**2 + (c1[k:, None]*start).imag**2)
+            return float(np.sum(side @ length))/2
+        surface = area*abs(w[0])**2 + walls(frames, 0)
+        if hollow:
+            surface += (area - inner_area)*abs(w[-1])**2 + inner_area*abs(w[hollow_from])**2
+            surface += walls(inner_frames, hollow_from)
         else:
-            print("No filename provided")
-            return
+            surface += area*abs(w[-1])**2
+
+        # the convex hull of the outline under every ring's transform
+        radius = self.base_diameter/2
+        hull = w[:, None]*(radius*fractal_hull(self.fractal, self.koch_iterations, self.chamfer_r/radius, self._fn))
+        overhang = np.degrees(np.arctan2(self.base_diameter/2*shift, h))
+
+        radius = settings['filament_diameter']/2
+        filament = (floor + wall)*settings['extrusion_multiplier']/(math.pi*radius*radius)
+        flow = width*settings['layer_height']
+        return {
+            'volume': float(floor + wall),
+            'surface_area': float(surface),
+            'bounding_box': [[float(hull.real.min()), float(hull.imag.min()), float(z[0])],
+                             [float(hull.real.max()), float(hull.imag.max()), float(z[-1])]],
+            'overhang_deg': overhang.tolist(),
+            'max_overhang_deg': float(overhang.max()) if len(overhang) else 0.0,
+            'filament_mm': float(filament),
+            'print_seconds': float(floor/(flow*settings['floor_feed_rate']) + wall/(flow*settings['feed_rate'])),
+            'layers': len(z)-1,
+        }
 
     def get_sin_cos(self, function='sin', amplitude=1, period=1, phase=0, n_points=100, way = 'twist', over_0 = True):
-        scaled_period = period/self.height_per_layer
-        scaled_phase = phase/self.height_per_layer
-        if over_0:
-            curve_offset = amplitude/2
-        else:
-            curve_offset = 0
-        if way == 'twist':
-            amplitude = amplitude*self.height_per_layer
-        if way == 'scale':
-            amplitude = amplitude*self.base_diameter/100
-        if function == 'sin':
-            return [curve_offset+amplitude * math.sin(2 * math.pi * i / scaled_period + 2*math.pi*scaled_phase/scaled_period) for i in range(n_points)]
-        elif function == 'cos':
-            return [curve_offset+amplitude * math.cos(2 * math.pi * i / scaled_period + 2*math.pi*scaled_phase/scaled_period) for i in range(n_points)]
-        else:
-            return None
+        spec = {'type': function, 'amplitude': amplitude, 'period': period, 'phase': phase}
+        z = np.arange(n_points)*self.height_per_layer
+        return evaluate_profile(spec, z, way=way, over_0=over_0, **self.profile_context(n_points))
 
     def get_line(self, twist, n_points, way='twist'):
-        if twist['type'] == 'sin' or twist['type'] == 'cos':
-            return self.get_sin_cos(function=twist['type'], amplitude=twist['amplitude'], period=twist['period'], phase=twist['phase'], n_points = n_points, way = way)
-        if twist['type'] == 'total_scale':
-            return [i/n_points*self.base_diameter*(twist['scale']-1) for i in range(n_points)]
-        if twist['type'] == 'constant':
-            return [i*twist['value']/self.num_layers for i in range(n_points)]
-
-    def kochSnowflake(self, diameter=100, iterations=3):
+        z = np.arange(n_points)*self.height_per_layer
+        return evaluate_profile(twist, z, way=way, **self.profile_context(n_points))
+
+    def profile_context(self, n_points=None):
+        return dict(
+            height_per_layer=self.height_per_layer,
+            base_diameter=self.base_diameter,
+            num_layers=self.num_layers,
+            n_points=self.num_layers+1 if n_points is None else n_points,
+        )
+
+    def kochSnowflake(self, diameter=100, iterations=3, csg=False):
+        # Single polygon computed directly, csg=True keeps the nested union tree
+        if not csg:
+            return polygon(koch_outline(diameter, iterations).tolist())
         rad = diameter/2
         xrad = rad*math.sqrt(3)/2
         yrad = rad/2
@@ -125,45 +319,220 @@ class KochSnowflake_creator:
             koch.append(shape)
         return koch[-1]
 
-    def create(self):
-        shape = self.kochSnowflake(diameter=self.base_diameter, iterations=self.koch_iterations)
+    def layer_boundaries(self):
+        """Heights at which the layers start and end.
+
+        Every height_per_layer by default. With adaptive_tolerance set, only
+        the boundaries needed to follow the twist/scale curves within that
+        many mm are kept, plus the top of the floor.
+
+        :returns np.ndarray: increasing heights from 0 to the top
+        """
+        return self._artifact('boundaries', self._build_boundaries)
+
+    def _build_boundaries(self):
+        z = np.arange(self.num_layers+1)*self.height_per_layer
+        if not self.adaptive_tolerance:
+            return z
+        rota_list, scaling = self.get_layer_transforms(z)
+        keep = [self.floor_layer+1] if self.floor_layer+1 < self.num_layers else []
+        return z[adaptive_boundaries(z, rota_list, scaling, self.base_diameter/2, self.adaptive_tolerance, keep)]
+
+    def get_hollow_from(self, z):
+        # Index of the boundary in z where the inner wall starts
+        return int(np.searchsorted(z, (self.floor_layer+1)*self.height_per_layer))
+
+    def get_layer_transforms(self, z=None):
+        # Twist (degrees) and scale applied between consecutive boundaries z
+        if z is None:
+            return self._artifact('transforms', lambda: self.get_layer_transforms(self.layer_boundaries()))
+        return layer_transforms(self.twists_list, self.scaling_list, z, self.height_per_layer, self.base_diameter, self.num_layers)
+
+    def get_outline(self):
+        # Base outline of the lamp, chamfered like create() does it
+        return self._artifact('chamfered', self._build_outline)
+
+    def _build_outline(self):
+        def fractal():
+            with self._stage('fractal'):
+                return fractal_outline(self.fractal, self.base_diameter, self.koch_iterations)
+        outline = self._artifact('outline', fractal)
         if self.chamfer_r > 0:
-            shape = offset(r=-self.chamfer_r, _fn=self._fn)(shape)
-            shape = offset(r=self.chamfer_r*2, _fn=self._fn)(shape)
-            shape = offset(r=-self.chamfer_r, _fn=self._fn)(shape)
+            with self._stage('offsets'):
+                outline = chamfer_polygon(outline, self.chamfer_r, fn=self._fn)
+        self._count('outline_vertices', len(outline))
+        return outline
+
+    def get_inner_outline(self, outline, layer_scale=1):
+        # Inner wall as seen at the base; create() offsets the outline after
+        # it was scaled by layer_scale, so the distance shrinks accordingly
+        join = 'round' if self.chamfer_r > 0 else 'miter'
+        with self._stage('offsets'):
+            return offset_polygon(outline, -self.wall_thickness/layer_scale, join, fn=self._fn)
+
+    @property
+    def _inner_scale(self):
+        # Cumulative scale at the boundary where the cavity starts, None without one
+        z = self.layer_boundaries()
+        hollow_from = self.get_hollow_from(z)
+        if hollow_from >= len(z)-1:
+            return None
+        return float(np.concatenate([[1], np.cumprod(self.get_layer_transforms()[1])])[hollow_from])
+
+    def get_inner(self):
+        # Inner wall outline of the lamp, None if it has no cavity
+        def build():
+            layer_scale = self._inner_scale
+            if layer_scale is None:
+                return None
+            return self.get_inner_outline(self.get_outline(), layer_scale)
+        return self._artifact('inner', build)
+
+    def create(self):
+        # Rebuilds the solid2 tree only if something it depends on changed
+        with self._stage('create'):
+            self.body = self._artifact('body', self._build_body)
+
+    def _build_body(self):
+        if self.csg_outline:
+            if self.fractal != 'koch':
+                raise ValueError("csg_outline only builds the Koch snowflake, not %r" % (self.fractal,))
+            # OpenSCAD does the offsets on the nested union tree
+            with self._stage('fractal'):
+                shape = self.kochSnowflake(diameter=self.base_diameter, iterations=self.koch_iterations, csg=True)
+            if self.chamfer_r > 0:
+                shape = offset(r=-self.chamfer_r, _fn=self._fn)(shape)
+                shape = offset(r=self.chamfer_r*2, _fn=self._fn)(shape)
+                shape = offset(r=-self.chamfer_r, _fn=self._fn)(shape)
+        else:
+            outline = self.get_outline()
+            shape = polygon(outline.tolist())
 
         body = None
 
-        rota_list = [0]*self.num_layers
-        scaling = [1]*self.num_layers
-
-        if len(self.twists_list) > 0:
-            rota_list = sum(np.array(self.get_line(t, self.num_layers+1, way="twist")) for t in self.twists_list)
-            rota_list = [rota_list[i+1]-rota_list[i] for i in range(self.num_layers)]
-        if len(self.scaling_list) > 0:
-            scaling = sum(np.array(self.get_line(s, self.num_layers+1, way="scale")) for s in self.scaling_list)
-            scaling = [(self.base_diameter+scaling[i+1]*2)/(self.base_diameter+scaling[i]*2) for i in range(self.num_layers)]
-
-        hollow = False
-        for i in range(self.num_layers):
-            if not hollow and i > self.floor_layer:
-                if self.chamfer_r > 0:
-                    inner_shape = offset(r=-self.wall_thickness, _fn=self._fn)(shape)
+        z = self.layer_boundaries().tolist()
+        hollow_from = self.get_hollow_from(z)
+        rota_list, scaling = (a.tolist() for a in self.get_layer_transforms())
+
+        with self._stage('layers'):
+            hollow = False
+            layer_angle, layer_scale = 0, 1
+            for i in range(len(z)-1):
+                if not hollow and i >= hollow_from:
+                    if not self.csg_outline:
+                        inner_shape = polygon(self.get_inner().tolist())
+                        inner_shape = scale([layer_scale, layer_scale, 1])(rotate([0, 0, layer_angle])(inner_shape))
+                    elif self.chamfer_r > 0:
+                        inner_shape = offset(r=-self.wall_thickness, _fn=self._fn)(shape)
+                    else:
+                        inner_shape = offset(delta=-self.wall_thickness, _fn=self._fn)(shape)
+                    shape = shape-inner_shape
+                    hollow = True
+                layer = linear_extrude(height=z[i+1]-z[i], scale=scaling[i], twist=-rota_list[i], slices=1,)(shape)
+                layer = translate([0, 0, z[i]])(layer)
+                if body:
+                    body += layer
                 else:
-                    inner_shape = offset(delta=-self.wall_thickness, _fn=self._fn)(shape)
-                shape = shape-inner_shape
-                hollow = True
-            layer = linear_extrude(height=self.height_per_layer, scale=scaling[i], twist=-rota_list[i], slices=1,)(shape)
-            layer = translate([0, 0, self.height_per_layer*i])(layer)
-            if body:
-                body += layer
-            else:
-                body = layer
+                    body = layer
+
+                shape = rotate([0, 0, rota_list[i]])(shape)
+                shape = scale([scaling[i], scaling[i], 1])(shape)
+                layer_angle += rota_list[i]
+                layer_scale *= scaling[i]
+            self._count('layers', len(z)-1)
+
+        self._count('csg_nodes', lambda: count_nodes(body))
+        return body
+
+    def write_scad(self, filename, precision=6):
+        """Writes the lamp of create() as SCAD without building a solid2 tree.
+
+        The outline and the hollow wall are written once as modules; every
+        layer is a single statement extruding one of them under its
+        cumulative rotation and scale. Only for the array outline, the
+        csg_outline tree still needs create().
+
+        :param int precision: decimals written for every coordinate
+        :returns str: filename
+        """
+        z = self.layer_boundaries().tolist()
+        hollow_from = self.get_hollow_from(z)
+        rota_list, scaling = (a.tolist() for a in self.get_layer_transforms())
+        angles = np.concatenate([[0], np.cumsum(rota_list)]).tolist()
+        scales = np.concatenate([[1], np.cumprod(scaling)]).tolist()
+        inner = self.get_inner()
+        with open_scad(filename, precision) as w:
+            with w.module('outline'):
+                w.statement(w.polygon(self.get_outline()))
+            if inner is not None:
+                with w.module('wall'):
+                    with w.block(w.difference()):
+                        w.statement(w.use('outline'))
+                        # get_inner() is in base coordinates like the outline,
+                        # the layer statements apply the transforms
+                        w.statement(w.polygon(inner))
+            with w.block(w.union()):
+                for i in range(len(z)-1):
+                    s = scales[i]
+                    w.statement(
+                        w.translate([0, 0, z[i]]),
+                        w.linear_extrude(height=z[i+1]-z[i], scale=scaling[i], twist=-rota_list[i], slices=1),
+                        w.scale([s, s, 1]),
+                        w.rotate([0, 0, angles[i]]),
+                        w.use('wall' if i >= hollow_from else 'outline'),
+                    )
+        return filename
+
+    def create_mesh(self, slabs=1, workers=None):
+        """Sweeps the outline through all layer transforms without OpenSCAD.
+
+        Builds the same solid as create() (floor below floor_layer, hollow
+        wall above it) as one watertight triangle mesh stored in self.mesh.
+        With slabs > 1 the layer range is split into slabs that are meshed in
+        a process pool and welded along their shared rings.
+
+        :returns tuple: (vertices (V, 3) float64, faces (F, 3) int64)
+        """
+        def build():
+            if slabs > 1:
+                return sweep_mesh_parallel(*self.get_sweep_inputs(), slabs=slabs, workers=workers)
+            return sweep_mesh(*self.get_sweep_inputs())
+        with self._stage('create_mesh'):
+            self.mesh = self._artifact('mesh', build)
+            self._count('vertices', len(self.mesh[0]))
+            self._count('faces', len(self.mesh[1]))
+        return self.mesh
+
+    def validate(self, min_wall=0.0, mesh=False):
+        """Checks the lamp before it is rendered.
+
+        Ring crossings, the scale reached between rings and the thinnest
+        wall come from the sweep inputs in milliseconds; with mesh=True the
+        swept mesh is built and its edges checked as well.
+
+        :returns dict: findings of mesh_validation plus 'valid'
+        """
+        with self._stage('validate'):
+            report = validate_sweep(*self.get_sweep_inputs(), min_wall=min_wall)
+            if mesh:
+                report['mesh'] = validate_mesh(*self.create_mesh())
+                report['valid'] = report['valid'] and report['mesh']['valid']
+        return report
 
-            shape = rotate([0, 0, rota_list[i]])(shape)
-            shape = scale([scaling[i], scaling[i], 1])(shape)
+    def get_indexed_mesh(self, tolerance=0):
+        # create_mesh() as float32/uint32 IndexedMesh, about half the memory
+        return IndexedMesh(*self.create_mesh()).weld(tolerance)
 
-        self.body = body
+    def get_sweep_inputs(self):
+        # Outline, per-ring angles/scales/heights and inner wall of the lamp
+        outline = self.get_outline()
+        z = self.layer_boundaries()
+        rota_list, scaling = self.get_layer_transforms()
+        # cumulative transform of the outline at the bottom of every layer
+        angles = np.concatenate([[0], np.cumsum(rota_list)])
+        scales = np.concatenate([[1], np.cumprod(scaling)])
+        hollow_from = self.get_hollow_from(z)
+        return outline, angles, scales, z, self.get_inner(), hollow_from
 
 if __name__ == '__main__':
 
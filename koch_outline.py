@@ -0,0 +1,225 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+sqrt3 = np.sqrt(3)
+
+# Unit-radius outlines per iteration level, shared by the whole process
+_unit_outlines = OrderedDict()
+_lock = threading.Lock()
+cache_settings = {'max_levels': 8, 'directory': None}
+
+
+def configure_cache(max_levels=8, directory=None):
+    """Bounds the unit outline cache and optionally persists it.
+
+    :param int max_levels: iteration levels kept in memory
+    :param str directory: where levels are saved as .npy files and loaded
+        back memory-mapped, None to keep them in memory only
+    """
+    with _lock:
+        cache_settings.update(max_levels=max_levels, directory=directory)
+        while len(_unit_outlines) > max_levels:
+            _unit_outlines.popitem(last=False)
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+
+
+def clear_cache():
+    with _lock:
+        _unit_outlines.clear()
+
+
+def _level_path(iterations):
+    return os.path.join(cache_settings['directory'], 'koch_unit_%d.npy' % iterations)
+
+
+def _remember(iterations, points):
+    points.flags.writeable = False
+    _unit_outlines[iterations] = points
+    _unit_outlines.move_to_end(iterations)
+    while len(_unit_outlines) > cache_settings['max_levels']:
+        _unit_outlines.popitem(last=False)
+    return points
+
+
+def unit_koch_outline(iterations=3):
+    """Read-only koch_outline(2, iterations), built once per process.
+
+    Misses start from the deepest cached level below and subdivide from
+    there; with a cache directory configured, levels are also looked up in
+    and saved to it.
+    """
+    with _lock:
+        if iterations in _unit_outlines:
+            _unit_outlines.move_to_end(iterations)
+            return _unit_outlines[iterations]
+        directory = cache_settings['directory']
+        if directory is not None and os.path.exists(_level_path(iterations)):
+            return _remember(iterations, np.load(_level_path(iterations), mmap_mode='r'))
+        lower = [level for level in _unit_outlines if level < iterations]
+        level = max(lower) if lower else 0
+        points = _unit_outlines[level] if lower else np.array(
+            [(0, 1), (-sqrt3/2, -0.5), (sqrt3/2, -0.5)], dtype=np.float64)
+        for _ in range(iterations - level):
+            points = subdivide_koch(points)
+        if directory is not None:
+            tmp = '%s.%d.tmp.npy' % (_level_path(iterations)[:-4], os.getpid())
+            np.save(tmp, points)
+            os.replace(tmp, _level_path(iterations))
+        return _remember(iterations, points)
+
+
+def koch_outline(diameter=100, iterations=3):
+    """Outline of a Koch snowflake as a single counter-clockwise vertex ring.
+
+    Same shape as the CSG `kochSnowflake`: the base triangle has circumradius
+    diameter/2 with a vertex at (0, rad). Each level replaces every edge p->q
+    by p, b, c, d where b and d are the thirds of the edge and c is the tip
+    of the outward equilateral bump, so level n has 3*4**n vertices.
+
+    :param float diameter: diameter of the circle through the outer tips
+    :param int iterations: number of subdivision levels
+    :returns np.ndarray: (3*4**iterations, 2) float64 array of vertices
+    """
+    return unit_koch_outline(iterations)*(diameter/2)
+
+
+def subdivide_koch(points):
+    # One Koch level on a closed counter-clockwise ring: every edge p->q
+    # becomes p, b, c, d with the bump c on the right (outer) side of the edge
+    edge = np.roll(points, -1, axis=0) - points
+    normal = np.stack([edge[:, 1], -edge[:, 0]], axis=1)
+    b = points + edge/3
+    c = points + edge/2 + normal*(sqrt3/6)
+    d = points + edge*(2/3)
+    return np.stack([points, b, c, d], axis=1).reshape(-1, 2)
+
+
+def koch_area(diameter=100, iterations=3):
+    # Closed form of the area enclosed by koch_outline(diameter, iterations)
+    side = diameter/2*sqrt3
+    return sqrt3/4*side*side*(8/5 - 3/5*(4/9)**iterations)
+
+
+def koch_perimeter(diameter=100, iterations=3):
+    return 3*diameter/2*sqrt3*(4/3)**iterations
+
+
+def _inset_level(diameter, iterations, distance):
+    # Deepest level whose edges are still longer than 2/sqrt(3)*distance
+    level = iterations
+    side = diameter/2*sqrt3
+    while level > 0 and side/3**level < 2*distance/sqrt3:
+        level -= 1
+    return level
+
+
+def koch_inset(diameter=100, iterations=3, distance=0):
+    """Area and perimeter of the outline offset inwards by distance (miter).
+
+    Below the level whose edges are still longer than the 2/sqrt(3)*distance
+    a miter offset eats from them, the bumps lie entirely inside the offset
+    band and do not change the inner outline. Down to that level the offset
+    polygon keeps every edge, so the Steiner formula A - P*d + d**2*T holds,
+    with T the sum of tan(turn/2) over the 4**m + 2 corners turning 120 and
+    the 2*(4**m - 1) turning -60 degrees.
+
+    :returns tuple: (area, perimeter), zero when nothing is left
+    """
+    level = _inset_level(diameter, iterations, distance)
+    corners = sqrt3*(4**level + 2) - 2*(4**level - 1)/sqrt3
+    area = koch_area(diameter, level) - koch_perimeter(diameter, level)*distance + corners*distance*distance
+    perimeter = koch_perimeter(diameter, level) - 2*corners*distance
+    if area <= 0 or perimeter <= 0:
+        return 0.0, 0.0
+    return float(area), float(perimeter)
+
+
+def koch_inset_outline(diameter=100, iterations=3, distance=0):
+    """The ring koch_inset measures, None when nothing is left.
+
+    Every edge of koch_inset's level survives the offset, so each vertex
+    simply moves to where the offset lines of its two edges meet.
+    """
+    if koch_inset(diameter, iterations, distance)[0] == 0:
+        return None
+    points = koch_outline(diameter, _inset_level(diameter, iterations, distance))
+    p = points[:, 0] + 1j*points[:, 1]
+    # inward normals of the edges ending and starting at every vertex
+    normal = 1j*(np.roll(p, -1) - p)
+    normal /= np.abs(normal)
+    before = np.roll(normal, 1)
+    p = p + distance*(before + normal)/(1 + (before*normal.conj()).real)
+    return np.stack([p.real, p.imag], axis=1)
+
+
+def edge_frames(points):
+    """Edges of a counter-clockwise ring, each seen in its own frame.
+
+    Every edge p->q is turned about the centre until it points along +x.
+    The wall two transformed copies of the ring span only depends on
+    where p and q land, so edges landing on the same pair, like the
+    rotated copies of a symmetric outline, are merged into one.
+
+    :returns tuple: total length, start and end (complex) of every
+        distinct edge
+    """
+    p = points[:, 0] + 1j*points[:, 1]
+    edge = np.roll(p, -1) - p
+    length = np.abs(edge)
+    turn = edge.conj()/length
+    start, end = p*turn, np.roll(p, -1)*turn
+    rows = np.round(np.stack([start.real, start.imag, end.real, end.imag], axis=1), 9)
+    rows, index = np.unique(rows, axis=0, return_inverse=True)
+    length = np.bincount(index.reshape(-1), length, len(rows))
+    return length, rows[:, 0] + 1j*rows[:, 1], rows[:, 2] + 1j*rows[:, 3]
+
+
+def convex_hull(points):
+    """Counter-clockwise convex hull of (n, 2) points.
+
+    Points inside or on the polygon of the extremes in 64 directions are
+    dropped first, which leaves only a few of a fractal outline's vertices
+    for the monotone chain.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    a = np.radians(np.arange(0, 360, 5.625))
+    extremes = np.unique([np.argmax(points @ d) for d in np.stack([np.cos(a), np.sin(a)], axis=1)])
+    ring = points[extremes]
+    ring = ring[np.argsort(np.arctan2(*(ring - ring.mean(axis=0)).T[::-1]))]
+    if len(ring) >= 3:
+        edge = np.roll(ring, -1, axis=0) - ring
+        inside = np.ones(len(points), dtype=bool)
+        for p, e in zip(ring, edge):
+            inside &= e[0]*(points[:, 1] - p[1]) - e[1]*(points[:, 0] - p[0]) >= 0
+        points = np.concatenate([points[~inside], ring])
+    points = np.unique(points, axis=0).tolist()
+    if len(points) < 3:
+        return np.array(points).reshape(-1, 2)
+
+    def chain(ordered):
+        hull = []
+        for p in ordered:
+            while len(hull) >= 2 and ((hull[-1][0] - hull[-2][0])*(p[1] - hull[-2][1])
+                                      - (hull[-1][1] - hull[-2][1])*(p[0] - hull[-2][0])) <= 0:
+                hull.pop()
+            hull.append(p)
+        return hull[:-1]
+    return np.array(chain(points) + chain(points[::-1]))
+
+
+@functools.lru_cache(maxsize=None)
+def koch_hull(iterations=3):
+    # Complex convex hull vertices of the unit outline; from the second level
+    # on bumps reach past the hexagon of the six tips
+    hull = convex_hull(unit_koch_outline(iterations))
+    hull = hull[:, 0] + 1j*hull[:, 1]
+    hull.flags.writeable = False
+    return hull
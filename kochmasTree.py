@@ -6,9 +6,18 @@ import math
 
 # Assumes SolidPython is in site-packages
 from solid2 import *
+from fractals import fractal_outline, fractal_symmetry
+from mesh_sweep import extrude_rings, sweep_to_apex
+from stl_writer import save_mesh_stl
+import numpy as np
 # from solid2.utils import *
 
-def kochSnowflake(diameter=100, iterations=3):
+def kochSnowflake(diameter=100, iterations=3, csg=False, fractal='koch'):
+    # Single polygon computed directly, csg=True keeps the nested union tree
+    if not csg:
+        return polygon(fractal_outline(fractal, diameter, iterations).tolist())
+    if fractal != 'koch':
+        raise ValueError("only the Koch snowflake has a CSG construction")
     rad = diameter/2
     xrad = rad*math.sqrt(3)/2
     yrad = rad/2
@@ -29,6 +38,43 @@ def kochSnowflake(diameter=100, iterations=3):
         koch.append(shape)
     return koch[-1]
 
+def kochmasTree_mesh(
+        diameter=100,
+        height=150,
+        top_twist=180,
+        base_diameter=50,
+        base_height=25,
+        base_twist=0,
+        top_slices=100,
+        base_slices=2,
+        koch_iterations=3,
+        fractal='koch',
+        ):
+    """Triangle mesh of kochmasTree() swept directly, without CSG booleans.
+
+    Trunk and top share the ring at base_height, so the union is a single
+    sweep from the bottom cap up to the apex. That needs the trunk to end
+    on the outline the top starts with, i.e. a base_twist that is a
+    multiple of the outline's symmetry, 60 degrees for the snowflake and
+    120 for its level 0 triangle.
+
+    :returns tuple: (vertices (V, 3) float64, faces (F, 3) int64)
+    """
+    if base_twist % fractal_symmetry(fractal, koch_iterations):
+        raise ValueError("base_twist=%g does not line up with the top, use csg=True" % base_twist)
+    outline = fractal_outline(fractal, base_diameter, koch_iterations)
+    size = diameter/base_diameter
+    trunk = extrude_rings(base_height, base_twist, size, base_slices)
+    # the top turned by -base_twist looks the same and continues the trunk
+    top = extrude_rings(height-base_height, top_twist, 0, top_slices, z0=base_height)
+    top = (top[0] - base_twist, top[1]*size, top[2])
+    if base_height > 0:
+        # the first ring of the top is the last of the trunk, its last the apex
+        angles, scales, z = (np.concatenate([t, p[1:-1]]) for t, p in zip(trunk, top))
+    else:
+        angles, scales, z = (p[:-1] for p in top)
+    return sweep_to_apex(outline, angles, scales, z, (0, 0, height))
+
 def kochmasTree(
         diameter=100,        # Diameter of tree at widest point
         height=150,         # Total height of tree
@@ -39,9 +85,14 @@ def kochmasTree(
         top_slices=100,     # Slices of top of tree extrusion
         base_slices=2,      # Slices of base extrusion
         koch_iterations=3,  # iterations of Koch Snowflake
+        csg=False,          # solid2 object instead of a (vertices, faces) mesh
+        fractal='koch',     # outline preset or {'seed', 'rule'} of fractals.py
         ):
-    snowflake = kochSnowflake(diameter=diameter, iterations=koch_iterations)
-    base_snowflake = kochSnowflake(diameter=base_diameter, iterations=koch_iterations)
+    if not csg:
+        return kochmasTree_mesh(diameter, height, top_twist, base_diameter, base_height,
+                                base_twist, top_slices, base_slices, koch_iterations, fractal)
+    snowflake = kochSnowflake(diameter=diameter, iterations=koch_iterations, fractal=fractal)
+    base_snowflake = kochSnowflake(diameter=base_diameter, iterations=koch_iterations, fractal=fractal)
     trunk = linear_extrude(
                 height=base_height,
                 scale=diameter/base_diameter,
@@ -61,7 +112,6 @@ def kochmasTree(
 
 if __name__ == '__main__':
     fractalChrismasTree = kochmasTree()
-    # print(scad_render(fractalChrismasTree))
 
-    # save your model for use in OpenSCAD
-    fractalChrismasTree.save_as_scad()
+    # save your model, kochmasTree(csg=True).save_as_scad() for use in OpenSCAD
+    save_mesh_stl('kochmasTree.stl', *fractalChrismasTree)
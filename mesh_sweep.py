@@ -0,0 +1,381 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def signed_area(points):
+    # Shoelace formula, positive for counter-clockwise rings
+    x, y = points[:, 0], points[:, 1]
+    return 0.5*np.sum(x*np.roll(y, -1) - np.roll(x, -1)*y)
+
+
+def _cross(u, v):
+    return u[..., 0]*v[..., 1] - u[..., 1]*v[..., 0]
+
+
+def _alternate(mask):
+    # Keep every other True inside each run of consecutive Trues so that no
+    # two selected vertices are neighbours on the (cyclic) ring
+    n = len(mask)
+    pos = np.arange(n)
+    starts = mask & ~np.roll(mask, 1)
+    run_start = np.maximum.accumulate(np.where(starts, pos, 0))
+    selected = mask & ((pos - run_start) % 2 == 0)
+    if n > 1 and selected[0] and selected[-1]:
+        selected[-1] = False
+    return selected
+
+
+def triangulate_polygon(points, chunk_size=1 << 22):
+    """Triangulates a simple polygon by batched ear clipping.
+
+    Every round tests all convex vertices against the reflex vertices inside
+    their x-range at once and clips a set of non-adjacent ears, so the number
+    of Python-level rounds stays small even for deep Koch outlines.
+
+    :param np.ndarray points: (n, 2) or (n, 3) ring, either orientation
+    :param int chunk_size: max number of point/triangle tests held in memory
+    :returns np.ndarray: (n-2, 3) int64 indices, counter-clockwise in xy
+    """
+    pts = np.asarray(points, dtype=np.float64)[:, :2]
+    idx = np.arange(len(pts))
+    if signed_area(pts) < 0:
+        idx = idx[::-1]
+    extent = np.ptp(pts, axis=0).max() if len(pts) else 0
+    eps = 1e-12*extent*extent
+    triangles = []
+    while len(idx) > 3:
+        n = len(idx)
+        p = pts[idx]
+        prev = np.roll(p, 1, axis=0)
+        nxt = np.roll(p, -1, axis=0)
+        convex = _cross(p - prev, nxt - p) > eps
+        ear = convex.copy()
+        reflex = np.flatnonzero(~convex)
+        if len(reflex):
+            reflex = reflex[np.argsort(p[reflex, 0], kind='stable')]
+            reflex_x = p[reflex, 0]
+            candidates = np.flatnonzero(convex)
+            corners = np.stack([prev[candidates], p[candidates], nxt[candidates]], axis=1)
+            lo = np.searchsorted(reflex_x, corners[:, :, 0].min(axis=1), side='left')
+            hi = np.searchsorted(reflex_x, corners[:, :, 0].max(axis=1), side='right')
+            counts = hi - lo
+            ends = np.cumsum(counts)
+            first = 0
+            while first < len(candidates):
+                # candidates whose pair tests fit into one chunk
+                last = max(first + 1, np.searchsorted(ends, ends[first] - counts[first] + chunk_size, side='right'))
+                sel = np.arange(first, min(last, len(candidates)))
+                first = sel[-1] + 1
+                cnt = counts[sel]
+                total = cnt.sum()
+                if total == 0:
+                    continue
+                owner = np.repeat(sel, cnt)
+                offset = np.arange(total) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+                which = reflex[np.repeat(lo[sel], cnt) + offset]
+                r = p[which]
+                a, b, d = corners[owner, 0], corners[owner, 1], corners[owner, 2]
+                inside = ((_cross(b - a, r - a) >= -eps)
+                          & (_cross(d - b, r - b) >= -eps)
+                          & (_cross(a - d, r - d) >= -eps))
+                # the ear's own corners (or copies of them) do not block it
+                c = candidates[owner]
+                inside &= (which != (c - 1) % n) & (which != (c + 1) % n)
+                inside &= np.any(r != a, axis=1) & np.any(r != d, axis=1)
+                blocked = np.bincount(owner[inside], minlength=len(candidates))[sel] > 0
+                ear[candidates[sel]] = ~blocked
+        clip = _alternate(ear)
+        if not clip.any():
+            # a leftover sliver of nearly collinear vertices has no ear by
+            # the eps test, clip its sharpest corner instead
+            if abs(signed_area(p)) > n*eps:
+                raise ValueError("polygon is not simple, no ear left to clip")
+            clip[np.argmax(_cross(p - prev, nxt - p))] = True
+        c = np.flatnonzero(clip)
+        triangles.append(np.stack([idx[c - 1], idx[c], idx[(c + 1) % n]], axis=1))
+        idx = idx[~clip]
+    if len(idx) == 3:
+        triangles.append(idx[None, :])
+    if not triangles:
+        return np.empty((0, 3), dtype=np.int64)
+    return np.concatenate(triangles).astype(np.int64)
+
+
+def stitch_rings(outer, inner, outer_start=0, inner_start=0):
+    """Triangulates the band between two counter-clockwise rings.
+
+    The rings may have different vertex counts; they are matched by
+    normalized arc length, starting from the inner vertex closest to the
+    first outer vertex.
+
+    :param np.ndarray outer: (n, 2+) outer ring
+    :param np.ndarray inner: (m, 2+) inner ring
+    :param int outer_start: vertex index of outer[0] in the final mesh
+    :param int inner_start: vertex index of inner[0] in the final mesh
+    :returns np.ndarray: (n+m, 3) int64 faces, counter-clockwise in xy
+    """
+    outer = np.asarray(outer, dtype=np.float64)[:, :2]
+    inner = np.asarray(inner, dtype=np.float64)[:, :2]
+    n, m = len(outer), len(inner)
+    shift = np.argmin(np.sum((inner - outer[0])**2, axis=1))
+    inner_order = np.roll(np.arange(m), -shift)
+
+    def arc(ring):
+        seg = np.linalg.norm(np.roll(ring, -1, axis=0) - ring, axis=1)
+        t = np.cumsum(seg)
+        return t/t[-1]
+
+    # parameter reached after each step along either ring
+    steps = np.concatenate([arc(outer), arc(inner[inner_order])])
+    order = np.argsort(steps, kind='stable')
+    on_outer = order < n
+    i = np.cumsum(on_outer)
+    j = np.cumsum(~on_outer)
+    i_prev, j_prev = i - on_outer, j - ~on_outer
+    o_prev = outer_start + i_prev % n
+    o_next = outer_start + i % n
+    b_prev = inner_start + inner_order[j_prev % m]
+    b_next = inner_start + inner_order[j % m]
+    return np.where(on_outer[:, None],
+                    np.stack([o_prev, o_next, b_prev], axis=1),
+                    np.stack([o_prev, b_next, b_prev], axis=1)).astype(np.int64)
+
+
+def ring_stack(outline, angles, scales, z):
+    """Copies of an outline rotated, scaled and lifted per ring.
+
+    :param np.ndarray outline: (m, 2) ring
+    :param angles: (L,) counter-clockwise rotation of each ring in degrees
+    :param scales: (L,) uniform xy scale of each ring
+    :param z: (L,) height of each ring
+    :returns np.ndarray: (L, m, 3) vertices
+    """
+    outline = np.asarray(outline, dtype=np.float64)
+    theta = np.radians(np.asarray(angles, dtype=np.float64))
+    scales = np.asarray(scales, dtype=np.float64)
+    # rows of the (L, 2, 2) rotation-scale matrices, broadcast over all points
+    cos = (np.cos(theta)*scales)[:, None]
+    sin = (np.sin(theta)*scales)[:, None]
+    x, y = outline[None, :, 0], outline[None, :, 1]
+    rings = np.empty((len(theta), len(outline), 3))
+    np.subtract(cos*x, sin*y, out=rings[:, :, 0])
+    np.add(sin*x, cos*y, out=rings[:, :, 1])
+    rings[:, :, 2] = np.asarray(z, dtype=np.float64)[:, None]
+    return rings
+
+
+def extrude_rings(height, twist=0, scale=1, slices=1, z0=0):
+    # Ring transforms of linear_extrude(height, twist, scale, slices): the
+    # twist turns clockwise and the scale changes linearly with the height
+    f = np.linspace(0, 1, slices + 1)
+    return -twist*f, 1 + (scale - 1)*f, z0 + height*f
+
+
+def interpolate_ring(angle0, scale0, angle1, scale1, t):
+    """Transform of the ring a fraction t along the walls between two rings.
+
+    The walls run straight from each vertex of one ring to the same vertex
+    of the next, and a blend of two rotation-scales is again one, so the
+    cut through them is the outline under a single angle and scale.
+
+    :returns tuple: (angle in degrees, scale)
+    """
+    w = (1 - t)*scale0*np.exp(1j*np.radians(angle0)) + t*scale1*np.exp(1j*np.radians(angle1))
+    return np.degrees(np.angle(w)), np.abs(w)
+
+
+def side_faces(n_rings, ring_size, start=0, inward=False):
+    # Two triangles per quad between consecutive rings; normals point to the
+    # right of the ring direction (outwards for a counter-clockwise ring)
+    k = start + np.arange(n_rings - 1, dtype=np.int64)[:, None]*ring_size
+    j = np.arange(ring_size, dtype=np.int64)
+    p = k + j
+    q = k + np.roll(j, -1)
+    faces = np.empty((n_rings - 1, ring_size, 2, 3), dtype=np.int64)
+    a, b = (2, 0) if inward else (0, 2)
+    faces[:, :, 0, a] = p
+    faces[:, :, 0, 1] = q
+    faces[:, :, 0, b] = q + ring_size
+    faces[:, :, 1, a] = p
+    faces[:, :, 1, 1] = q + ring_size
+    faces[:, :, 1, b] = p + ring_size
+    return faces.reshape(-1, 3)
+
+
+def sweep_mesh(outline, angles, scales, z, inner=None, hollow_from=None):
+    """Watertight mesh of an outline swept through per-ring transforms.
+
+    Ring k of the outer wall is `outline` rotated by angles[k] and scaled by
+    scales[k] at height z[k]. If `inner` is given, rings hollow_from..end
+    also get an inner wall; the part below ring hollow_from stays solid and
+    its top is the floor of the cavity. With hollow_from=0 the result is a
+    tube, open at both ends.
+
+    :param np.ndarray outline: (m, 2) counter-clockwise outer ring
+    :param np.ndarray inner: (mi, 2) counter-clockwise inner ring or None
+    :param int hollow_from: first ring of the inner wall
+    :returns tuple: (vertices (V, 3) float64, faces (F, 3) int64)
+    """
+    vertices, faces, _ = sweep_slab(outline, angles, scales, z, 0, len(z) - 1, inner, hollow_from)
+    return vertices, faces
+
+
+def sweep_to_apex(outline, angles, scales, z, apex):
+    """Watertight mesh of an outline swept through rings and closed in a point.
+
+    Like sweep_mesh() without inner wall, but instead of a top cap the
+    last ring is joined to the apex by a fan of triangles.
+
+    :param apex: (x, y, z) tip above the last ring
+    :returns tuple: (vertices (V, 3) float64, faces (F, 3) int64)
+    """
+    rings = ring_stack(outline, angles, scales, z)
+    n_rings, m = rings.shape[:2]
+    top = (n_rings - 1)*m
+    j = np.arange(m, dtype=np.int64)
+    fan = np.stack([top + j, top + np.roll(j, -1), np.full(m, n_rings*m)], axis=1)
+    vertices = np.concatenate([rings.reshape(-1, 3), np.asarray(apex, dtype=np.float64)[None]])
+    faces = np.concatenate([triangulate_polygon(outline)[:, ::-1], side_faces(n_rings, m), fan])
+    return vertices, faces
+
+
+def sweep_slab(outline, angles, scales, z, start, stop, inner=None, hollow_from=None):
+    """Part of sweep_mesh() between rings start and stop (both included).
+
+    Only the slab holding ring 0 gets the bottom cap, only the one holding
+    the last ring gets the top, and the cavity floor goes to the slab in
+    which the inner wall starts. The transforms of every ring come from the
+    global arrays, so neighbouring slabs share bit-identical boundary rings.
+
+    :returns tuple: vertices, faces and the vertex indices of the boundary
+        rings as {'bottom': {'outer': idx, 'inner': idx or None}, 'top': ...}
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    scales = np.asarray(scales, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    last = len(z) - 1
+    hollow = inner is not None and hollow_from is not None and hollow_from < last
+    rings = ring_stack(outline, angles[start:stop+1], scales[start:stop+1], z[start:stop+1])
+    n_rings, m = rings.shape[:2]
+    vertices = [rings.reshape(-1, 3)]
+    faces = [side_faces(n_rings, m)]
+    cap = triangulate_polygon(outline)
+    top = (n_rings - 1)*m
+    boundaries = {
+        'bottom': {'outer': np.arange(m), 'inner': None},
+        'top': {'outer': top + np.arange(m), 'inner': None},
+    }
+    if start == 0 and not (hollow and hollow_from == 0):
+        faces.append(cap[:, ::-1])
+    if not hollow:
+        if stop == last:
+            faces.append(cap + top)
+        return np.concatenate(vertices), np.concatenate(faces), boundaries
+    first = max(start, hollow_from)
+    if first < stop:
+        inner_rings = ring_stack(inner, angles[first:stop+1], scales[first:stop+1], z[first:stop+1])
+        mi = inner_rings.shape[1]
+        offset = n_rings*m
+        inner_top = offset + (len(inner_rings) - 1)*mi
+        vertices.append(inner_rings.reshape(-1, 3))
+        faces.append(side_faces(len(inner_rings), mi, start=offset, inward=True))
+        boundaries['top']['inner'] = inner_top + np.arange(mi)
+        if first == 0:
+            faces.append(stitch_rings(outline, inner, inner_start=offset)[:, ::-1])
+        elif first == hollow_from:
+            faces.append(triangulate_polygon(inner) + offset)
+        else:
+            boundaries['bottom']['inner'] = offset + np.arange(mi)
+        if stop == last:
+            faces.append(stitch_rings(outline, inner, outer_start=top, inner_start=inner_top))
+    return np.concatenate(vertices), np.concatenate(faces), boundaries
+
+
+def weld_slabs(slabs, tolerance=1e-9):
+    """Joins consecutive sweep_slab() results into one mesh.
+
+    The bottom boundary rings of every slab are merged into the top rings
+    of the slab below instead of going through a CSG union.
+
+    :param list slabs: (vertices, faces, boundaries) in ring order
+    :returns tuple: (vertices (V, 3) float64, faces (F, 3) int64)
+    """
+    vertices, faces = [], []
+    count = 0
+    previous = {}
+    for slab_vertices, slab_faces, boundaries in slabs:
+        mapping = np.full(len(slab_vertices), -1, dtype=np.int64)
+        for wall, here in boundaries['bottom'].items():
+            if here is None or previous.get(wall) is None:
+                continue
+            below, below_points = previous[wall]
+            gap = np.abs(below_points - slab_vertices[here]).max()
+            if gap > tolerance*max(1, np.abs(below_points).max()):
+                raise ValueError("slab boundary rings do not coincide (gap %g)" % gap)
+            mapping[here] = below
+        keep = mapping < 0
+        mapping[keep] = count + np.arange(keep.sum())
+        count += keep.sum()
+        vertices.append(slab_vertices[keep])
+        faces.append(mapping[slab_faces])
+        previous = {wall: None if idx is None else (mapping[idx], slab_vertices[idx])
+                    for wall, idx in boundaries['top'].items()}
+    return np.concatenate(vertices), np.concatenate(faces)
+
+
+def sweep_mesh_parallel(outline, angles, scales, z, inner=None, hollow_from=None, slabs=None, workers=None):
+    """sweep_mesh() split into slabs that are built in separate processes.
+
+    :param int slabs: number of slabs, one per worker by default
+    :param int workers: process pool size, os.cpu_count() when None
+    """
+    last = len(z) - 1
+    slabs = min(slabs or workers or os.cpu_count(), last)
+    cuts = np.unique(np.linspace(0, last, slabs + 1).round().astype(int))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(sweep_slab, outline, angles, scales, z, start, stop, inner, hollow_from)
+                   for start, stop in zip(cuts[:-1], cuts[1:])]
+        return weld_slabs([f.result() for f in futures])
+
+
+def iter_sweep_triangles(outline, angles, scales, z, inner=None, hollow_from=None, rings_per_chunk=64):
+    """Triangles of sweep_mesh() generated a few layers at a time.
+
+    Yields (k, 3, 3) corner arrays so that writers can stream very tall or
+    very fine lamps without holding the whole mesh in memory.
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    scales = np.asarray(scales, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    n_rings = len(z)
+
+    def ring(shape, k):
+        return ring_stack(shape, angles[k:k+1], scales[k:k+1], z[k:k+1])[0]
+
+    def walls(shape, first, inward):
+        for start in range(first, n_rings - 1, rings_per_chunk):
+            stop = min(start + rings_per_chunk, n_rings - 1)
+            rings = ring_stack(shape, angles[start:stop+1], scales[start:stop+1], z[start:stop+1])
+            yield rings.reshape(-1, 3)[side_faces(len(rings), len(shape), inward=inward)]
+
+    cap = triangulate_polygon(outline)
+    hollow = inner is not None and hollow_from is not None and hollow_from < n_rings - 1
+    if hollow and hollow_from == 0:
+        rim = np.concatenate([ring(outline, 0), ring(inner, 0)])
+        yield rim[stitch_rings(outline, inner, inner_start=len(outline))[:, ::-1]]
+    else:
+        yield ring(outline, 0)[cap[:, ::-1]]
+    yield from walls(outline, 0, False)
+    if not hollow:
+        yield ring(outline, n_rings - 1)[cap]
+        return
+    yield from walls(inner, hollow_from, True)
+    if hollow_from > 0:
+        yield ring(inner, hollow_from)[triangulate_polygon(inner)]
+    rim = np.concatenate([ring(outline, n_rings - 1), ring(inner, n_rings - 1)])
+    yield rim[stitch_rings(outline, inner, inner_start=len(outline))]
@@ -0,0 +1,164 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from polygon_offset import _ragged_arange, segment_intersections, winding_number
+
+
+def edge_report(faces, n_vertices=None):
+    """Manifoldness of a triangle mesh from its sorted edge keys.
+
+    Every undirected edge of a closed, consistently oriented mesh belongs to
+    exactly two faces that run through it in opposite directions.
+
+    :param np.ndarray faces: (F, 3) vertex indices
+    :returns dict: counts of boundary (1 face), non-manifold (3+ faces) and
+        misoriented (same direction twice) edges and of degenerate faces,
+        plus 'watertight' when all of them are zero
+    """
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    n = int(faces.max()) + 1 if n_vertices is None and len(faces) else (n_vertices or 0)
+    start = faces.reshape(-1)
+    end = faces[:, [1, 2, 0]].reshape(-1)
+    _, uses = np.unique(np.minimum(start, end)*n + np.maximum(start, end), return_counts=True)
+    _, directed = np.unique(start*n + end, return_counts=True)
+    report = {
+        'edges': len(uses),
+        'boundary_edges': int(np.count_nonzero(uses == 1)),
+        'nonmanifold_edges': int(np.count_nonzero(uses > 2)),
+        'misoriented_edges': int(np.count_nonzero(directed > 1)),
+        'degenerate_faces': int(np.count_nonzero((faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2])
+                                                 | (faces[:, 2] == faces[:, 0]))),
+    }
+    report['watertight'] = not any(report[k] for k in ('boundary_edges', 'nonmanifold_edges',
+                                                      'misoriented_edges', 'degenerate_faces'))
+    return report
+
+
+def signed_volume(vertices, faces):
+    # Positive for a closed mesh with outward (counter-clockwise) faces
+    corners = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)[np.asarray(faces, dtype=np.int64)]
+    return float(np.einsum('ij,ij->i', corners[:, 0], np.cross(corners[:, 1], corners[:, 2])).sum()/6)
+
+
+def ring_crossings(*rings):
+    """Edge crossings within and between closed rings.
+
+    The rings are chained into one closed ring, each closed by a repeat of
+    its first vertex, so the grid-bucketed segment_intersections tests all of
+    them at once; the two bridges between rings are ignored.
+
+    :returns int: number of crossing edge pairs
+    """
+    rings = [np.asarray(r, dtype=np.float64)[:, :2] for r in rings]
+    chain = np.concatenate([np.concatenate([r, r[:1]]) for r in rings])
+    bridges = np.cumsum([len(r) + 1 for r in rings]) - 1
+    i, j, _, _ = segment_intersections(chain)
+    return int(np.count_nonzero(~np.isin(i, bridges) & ~np.isin(j, bridges)))
+
+
+def min_distance(points, ring, cell=None):
+    """Smallest distance from any of points to the edges of a closed ring.
+
+    Edges are binned on a grid and every point is only measured against the
+    edges of its own and the eight neighbouring cells. A minimum found that
+    way is exact when it is below the cell size; otherwise the cell size is
+    doubled and the search repeated.
+    """
+    points = np.asarray(points, dtype=np.float64)[:, :2]
+    a = np.asarray(ring, dtype=np.float64)[:, :2]
+    b = np.roll(a, -1, axis=0)
+    d = b - a
+    length2 = np.maximum(np.einsum('ij,ij->i', d, d), 1e-300)
+    origin = np.minimum(a.min(axis=0), points.min(axis=0))
+    extent = max(np.ptp(np.concatenate([a, points]), axis=0).max(), 1e-12)
+    if cell is None:
+        cell = 2*np.median(np.sqrt(length2))
+    cell = max(cell, extent*1e-6)
+    while True:
+        lo = np.floor((np.minimum(a, b) - origin)/cell).astype(np.int64)
+        hi = np.floor((np.maximum(a, b) - origin)/cell).astype(np.int64)
+        span = hi - lo + 1
+        counts = span[:, 0]*span[:, 1]
+        edge = np.repeat(np.arange(len(a)), counts)
+        k = _ragged_arange(counts)
+        rows = int(np.ceil(extent/cell)) + 3
+        key = (lo[edge, 0] + k % span[edge, 0] + 1)*rows + lo[edge, 1] + k//span[edge, 0] + 1
+        order = np.argsort(key, kind='stable')
+        key, edge = key[order], edge[order]
+        home = np.floor((points - origin)/cell).astype(np.int64) + 1
+        best = np.inf
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                query = (home[:, 0] + dx)*rows + home[:, 1] + dy
+                first = np.searchsorted(key, query, side='left')
+                n = np.searchsorted(key, query, side='right') - first
+                owner = np.repeat(np.arange(len(points)), n)
+                e = edge[np.repeat(first, n) + _ragged_arange(n)]
+                rel = points[owner] - a[e]
+                t = np.clip(np.einsum('ij,ij->i', rel, d[e])/length2[e], 0, 1)
+                if len(e):
+                    best = min(best, np.sqrt(np.min(np.sum((rel - t[:, None]*d[e])**2, axis=1))))
+        if best <= cell or cell >= 2*extent:
+            return float(best)
+        cell *= 2
+
+
+def ring_gap(outer, inner):
+    """Smallest horizontal distance between two closed rings, 0 if they cross."""
+    if ring_crossings(outer, inner):
+        return 0.0
+    return min(min_distance(inner, outer), min_distance(outer, inner))
+
+
+def min_slab_scale(angles, scales):
+    # Smallest |w| along the straight blend between consecutive rings, with
+    # w = scale*exp(i*angle); a cut through a slab is the outline under w
+    w = np.asarray(scales)*np.exp(1j*np.radians(angles))
+    w0, w1 = w[:-1], w[1:]
+    step = w1 - w0
+    t = np.clip(-(w0*step.conj()).real/np.maximum(abs(step)**2, 1e-300), 0, 1)
+    return abs(w0 + t*step)
+
+
+def validate_sweep(outline, angles, scales, z, inner=None, hollow_from=None, min_wall=0.0):
+    """Checks the inputs of a swept lamp without building its mesh.
+
+    Every ring and every cut between two rings is the base outline (and
+    inner wall) under one rotation and scale, which keeps simple rings
+    simple and scales distances uniformly. So the base rings are tested
+    once for crossings, and the wall thickness is their smallest distance
+    times the smallest scale any hollow cut reaches.
+
+    :param float min_wall: thinnest acceptable wall in mm
+    :returns dict: findings plus 'valid'
+    """
+    outline = np.asarray(outline, dtype=np.float64)[:, :2]
+    slab_scale = min_slab_scale(angles, scales)
+    report = {
+        'outline_crossings': ring_crossings(outline),
+        'min_scale': float(slab_scale.min()) if len(slab_scale) else 1.0,
+        'max_layer_twist': float(np.max(np.abs(np.diff(angles)))) if len(angles) > 1 else 0.0,
+    }
+    hollow = inner is not None and hollow_from is not None and hollow_from < len(z) - 1
+    if hollow:
+        inner = np.asarray(inner, dtype=np.float64)[:, :2]
+        report['inner_crossings'] = ring_crossings(inner)
+        gap = ring_gap(outline, inner)
+        # the inner wall must lie inside the outline, not around it
+        if gap > 0 and winding_number(outline, inner[0]) == 0:
+            gap = 0.0
+        report['min_wall'] = float(gap*slab_scale[hollow_from:].min())
+        report['floor_thickness'] = float(z[hollow_from] - z[0])
+    report['valid'] = (report['outline_crossings'] == 0 and report['min_scale'] > 0
+                       and (not hollow or (report['inner_crossings'] == 0 and report['min_wall'] > min_wall)))
+    return report
+
+
+def validate_mesh(vertices, faces):
+    # Edge report of an indexed mesh plus its volume, negative when inside out
+    report = edge_report(faces, len(np.asarray(vertices).reshape(-1, 3)))
+    report['volume'] = signed_volume(vertices, faces)
+    report['valid'] = report['watertight'] and report['volume'] > 0
+    return report
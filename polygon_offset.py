@@ -0,0 +1,291 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+from mesh_sweep import signed_area
+
+
+def _cross(u, v):
+    return u[..., 0]*v[..., 1] - u[..., 1]*v[..., 0]
+
+
+def _ragged_arange(counts):
+    # 0..c-1 for every c in counts, concatenated
+    counts = np.asarray(counts, dtype=np.int64)
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def remove_duplicates(points, eps=0):
+    # Drops vertices that coincide with their predecessor on the closed ring
+    keep = np.linalg.norm(points - np.roll(points, 1, axis=0), axis=1) > eps
+    if not keep.any():
+        return points[:1]
+    return points[keep]
+
+
+def simplify_ring(points, eps=0):
+    # Drops near duplicate vertices and the zero-width spikes the offset
+    # cleanup leaves where two strands overlapped
+    while len(points) > 3:
+        points = remove_duplicates(points, eps)
+        e_in = points - np.roll(points, 1, axis=0)
+        e_out = np.roll(points, -1, axis=0) - points
+        flat = np.abs(_cross(e_in, e_out)) <= eps*(np.linalg.norm(e_in, axis=1) + np.linalg.norm(e_out, axis=1))
+        spike = flat & (np.sum(e_in*e_out, axis=1) < 0)
+        # never two neighbours at once, their removals could interfere
+        spike &= ~np.roll(spike, 1)
+        if not spike.any():
+            break
+        points = points[~spike]
+    return points
+
+
+def split_pinches(points, eps=0):
+    # Cuts a ring that runs through the same point twice into its lobes
+    keys = np.round(points/max(eps, 1e-300)).astype(np.int64) if eps > 0 else points
+    seen = {}
+    stack = []
+    lobes = []
+    for index, key in enumerate(map(tuple, keys.tolist())):
+        if key in seen:
+            start = seen[key]
+            lobe = stack[start:]
+            del stack[start + 1:]
+            for k in lobe[1:]:
+                seen.pop(tuple(keys[k].tolist()), None)
+            lobes.append(points[lobe])
+            continue
+        seen[key] = len(stack)
+        stack.append(index)
+    lobes.append(points[stack])
+    return [lobe for lobe in lobes if len(lobe) >= 3]
+
+
+def raw_offset(points, delta, join='miter', fn=72):
+    """Offset curve of a counter-clockwise ring before any cleanup.
+
+    Every edge is moved by delta along its outer normal (inwards for a
+    negative delta). Where the moved edges open a gap it is closed by their
+    miter point or, for join='round', by an arc of fn segments per turn.
+    Where they overlap the curve detours through the original vertex, the
+    way Clipper does, so that the overlap cancels out in the winding number.
+    """
+    e_out = np.roll(points, -1, axis=0) - points
+    e_out /= np.linalg.norm(e_out, axis=1)[:, None]
+    e_in = np.roll(e_out, 1, axis=0)
+    # right normals point outside a counter-clockwise ring
+    n_in = np.stack([e_in[:, 1], -e_in[:, 0]], axis=1)
+    n_out = np.stack([e_out[:, 1], -e_out[:, 0]], axis=1)
+    turn = np.arctan2(_cross(e_in, e_out), np.sum(e_in*e_out, axis=1))
+    straight = np.abs(turn) < 1e-9
+    gap = (turn*delta > 0) & ~straight
+    overlap = (turn*delta < 0) & ~straight
+    if join == 'round':
+        steps = np.where(gap, np.maximum(1, np.ceil(fn*np.abs(turn)/(2*np.pi))), 0).astype(np.int64)
+    else:
+        steps = np.zeros(len(points), dtype=np.int64)
+    counts = np.where(overlap, 3, steps + 1)
+    owner = np.repeat(np.arange(len(points)), counts)
+    k = _ragged_arange(counts)
+    # arcs from n_in to n_out, the miter point for single point joins
+    phi = np.arctan2(n_in[owner, 1], n_in[owner, 0]) + k/np.maximum(steps, 1)[owner]*turn[owner]
+    out = points[owner] + delta*np.stack([np.cos(phi), np.sin(phi)], axis=1)
+    single = (counts == 1)[owner]
+    miter = points + delta*(n_in + n_out)/(1 + np.sum(n_in*n_out, axis=1))[:, None]
+    out[single] = miter[owner[single]]
+    detour = overlap[owner]
+    out[detour & (k == 0)] = (points + delta*n_in)[owner[detour & (k == 0)]]
+    out[detour & (k == 1)] = points[owner[detour & (k == 1)]]
+    out[detour & (k == 2)] = (points + delta*n_out)[owner[detour & (k == 2)]]
+    return out
+
+
+def segment_intersections(ring, cell=None, chunk_size=1 << 22):
+    """Crossings between the edges of a closed ring, found by grid buckets.
+
+    Edges are binned into square cells and only edges sharing a cell are
+    tested, so the cost follows the number of nearby edge pairs instead of
+    n**2. Touching at a vertex counts once, neighbouring edges never count.
+
+    :param np.ndarray ring: (n, 2) closed ring
+    :param float cell: bucket size, twice the median edge length by default
+    :param int chunk_size: max number of candidate pairs held in memory
+    :returns tuple: edge indices i < j, parameters t along i and u along j
+    """
+    n = len(ring)
+    empty = np.empty(0, dtype=np.int64)
+    if n < 4:
+        return empty, empty, np.empty(0), np.empty(0)
+    a = ring
+    b = np.roll(ring, -1, axis=0)
+    origin = ring.min(axis=0)
+    box_lo, box_hi = np.minimum(a, b), np.maximum(a, b)
+    if cell is None:
+        cell = 2*np.median(np.linalg.norm(b - a, axis=1))
+    cell = max(cell, np.ptp(ring, axis=0).max()*1e-9, 1e-300)
+    while True:
+        lo = np.floor((box_lo - origin)/cell).astype(np.int64)
+        hi = np.floor((box_hi - origin)/cell).astype(np.int64)
+        span = hi - lo + 1
+        counts = span[:, 0]*span[:, 1]
+        if counts.sum() <= 16*n:
+            break
+        cell *= 2
+    edge = np.repeat(np.arange(n), counts)
+    k = _ragged_arange(counts)
+    cx = lo[edge, 0] + k % span[edge, 0]
+    cy = lo[edge, 1] + k // span[edge, 0]
+    order = np.lexsort((edge, cy, cx))
+    edge, cx, cy = edge[order], cx[order], cy[order]
+    # pair every entry with the later entries of the same cell
+    cell_id = cx*(hi[:, 1].max() + 2) + cy
+    group_end = np.searchsorted(cell_id, cell_id, side='right')
+    partners = group_end - np.arange(len(edge)) - 1
+    found = []
+    total = np.cumsum(partners)
+    cuts = np.unique(np.searchsorted(total, np.arange(1, total[-1]//chunk_size + 1)*chunk_size, side='right'))
+    for start, stop in zip(np.concatenate([[0], cuts]), np.concatenate([cuts, [len(edge)]])):
+        first = np.repeat(np.arange(start, stop), partners[start:stop])
+        second = first + 1 + _ragged_arange(partners[start:stop])
+        i, j = edge[first], edge[second]
+        # test each pair once, in the first cell both edges share, and only
+        # if their bounding boxes overlap
+        keep = (cx[first] == np.maximum(lo[i, 0], lo[j, 0])) & (cy[first] == np.maximum(lo[i, 1], lo[j, 1]))
+        keep &= np.all(box_lo[i] <= box_hi[j], axis=1) & np.all(box_lo[j] <= box_hi[i], axis=1)
+        i, j = np.minimum(i, j)[keep], np.maximum(i, j)[keep]
+        keep = (j - i > 1) & ~((i == 0) & (j == n - 1))
+        i, j = i[keep], j[keep]
+        d1 = b[i] - a[i]
+        d2 = b[j] - a[j]
+        denom = _cross(d1, d2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = _cross(a[j] - a[i], d2)/denom
+            u = _cross(a[j] - a[i], d1)/denom
+        hit = (denom != 0) & (t >= 0) & (t < 1) & (u >= 0) & (u < 1)
+        found.append((i[hit], j[hit], t[hit], u[hit]))
+    if not found:
+        return empty, empty, np.empty(0), np.empty(0)
+    i, j, t, u = (np.concatenate(parts) for parts in zip(*found))
+    order = np.lexsort((j, i))
+    return i[order], j[order], t[order], u[order]
+
+
+def winding_number(ring, point):
+    # How often the closed ring winds counter-clockwise around point
+    a = ring - point
+    b = np.roll(a, -1, axis=0)
+    c = _cross(a, b)
+    up = (a[:, 1] <= 0) & (b[:, 1] > 0) & (c > 0)
+    down = (a[:, 1] > 0) & (b[:, 1] <= 0) & (c < 0)
+    return int(up.sum() - down.sum())
+
+
+def boundary_loops(curve, level=1):
+    """Boundary of the area a closed curve winds around at least `level` times.
+
+    The curve is cut at its self-crossings into pieces. The winding number
+    right of each piece follows from a running sum of +-1 per crossing
+    passed, and the pieces with `level` on their left and
+    level-1 on their right are linked back into loops, switching strands at
+    crossings where both continuations qualify.
+
+    :param np.ndarray curve: (n, 2) closed, possibly self-crossing ring
+    :returns list: (m, 2) rings, counter-clockwise outlines and clockwise holes
+    """
+    # a tiny fixed jitter turns coincident crossings and collinear overlaps,
+    # which symmetric fractal offsets are full of, into ordinary crossings;
+    # the output keeps the exact coordinates
+    extent = np.ptp(curve, axis=0).max()
+    eps = extent*1e-9
+    jittered = curve + np.random.default_rng(0).uniform(-1, 1, curve.shape)*extent*1e-10
+    i, j, t, u = segment_intersections(jittered)
+    n, k = len(curve), len(i)
+    direction = np.roll(jittered, -1, axis=0) - jittered
+    exact = curve[i] + t[:, None]*(np.roll(curve, -1, axis=0) - curve)[i]
+    crossing = jittered[i] + t[:, None]*direction[i]
+    # crossings inserted as vertices on both edges, ordered along the curve
+    seg = np.concatenate([np.arange(n), i, j])
+    pos = np.concatenate([np.full(n, -1.0), t, u])
+    order = np.lexsort((pos, seg))
+    coords = np.concatenate([curve, exact, exact])[order]
+    piece = np.diff(np.concatenate([jittered, crossing, crossing])[order], axis=0, append=0)
+    piece[-1] += jittered[0]
+    size = len(order)
+    where = np.empty(size, dtype=np.int64)
+    where[order] = np.arange(size)
+    twin = np.full(size, -1, dtype=np.int64)
+    twin[where[n:n + k]] = where[n + k:]
+    twin[where[n + k:]] = where[n:n + k]
+    # passing a strand that runs from our right to our left raises the
+    # winding number on our right by one
+    step = np.zeros(size, dtype=np.int64)
+    turn = np.sign(_cross(direction[j], direction[i])).astype(np.int64)
+    step[where[n:n + k]] = turn
+    step[where[n + k:]] = -turn
+    right = np.cumsum(step)
+    # anchor the running sum at the leftmost vertex, where the outer side
+    # winds zero times: the right of the outgoing piece after a left turn
+    v = where[np.argmin(jittered[:, 0])]
+    right += (0 if _cross(piece[v - 1], piece[v]) > 0 else -1) - right[v]
+    length = np.linalg.norm(piece, axis=1)
+    selected = (right == level - 1) & (length > 0)
+    visited = np.zeros(size, dtype=bool)
+    loops = []
+    for start in np.flatnonzero(selected):
+        if visited[start]:
+            continue
+        loop = []
+        p = start
+        while not visited[p] and selected[p]:
+            visited[p] = True
+            loop.append(p)
+            p = (p + 1) % size
+            if twin[p] >= 0 and selected[twin[p]]:
+                p = twin[p]
+        if len(loop) >= 3:
+            loops.extend(split_pinches(simplify_ring(coords[loop], eps), eps))
+    return loops
+
+
+def clean_offset(curve, reference):
+    # Outlines of a raw offset curve without swallowtails or overlaps,
+    # largest first
+    extent = np.ptp(reference, axis=0).max()
+    loops = [(signed_area(loop), loop) for loop in boundary_loops(curve)]
+    kept = [item for item in loops if item[0] > 1e-12*extent*extent]
+    kept.sort(key=lambda item: -item[0])
+    return [loop for _, loop in kept]
+
+
+def offset_polygons(points, delta, join='miter', fn=72):
+    """Offsets a simple polygon, like OpenSCAD's offset(delta=) / offset(r=).
+
+    :param np.ndarray points: (n, 2) simple ring, either orientation
+    :param float delta: distance, positive grows the polygon
+    :param str join: 'miter' (offset(delta=...)) or 'round' (offset(r=...))
+    :param int fn: arc segments per full turn for round joins
+    :returns list: counter-clockwise (m, 2) rings, largest first
+    """
+    points = remove_duplicates(np.asarray(points, dtype=np.float64)[:, :2])
+    if signed_area(points) < 0:
+        points = points[::-1]
+    if delta == 0:
+        return [points]
+    curve = remove_duplicates(raw_offset(points, delta, join, fn), 1e-12*np.ptp(points, axis=0).max())
+    return clean_offset(curve, points)
+
+
+def offset_polygon(points, delta, join='miter', fn=72):
+    # Largest ring of offset_polygons(), the one a lamp wall follows
+    rings = offset_polygons(points, delta, join, fn)
+    if not rings:
+        raise ValueError("offset by %g leaves nothing of the polygon" % delta)
+    return rings[0]
+
+
+def chamfer_polygon(points, r, fn=72):
+    # Rounds convex and concave corners like offset(-r), offset(2r), offset(-r)
+    points = offset_polygon(points, -r, 'round', fn)
+    points = offset_polygon(points, 2*r, 'round', fn)
+    return offset_polygon(points, -r, 'round', fn)
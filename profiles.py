@@ -0,0 +1,173 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+# Curve type name -> function(spec, z, context) evaluated on a whole z array
+profile_types = {}
+
+
+def profile_type(name):
+    def register(function):
+        profile_types[name] = function
+        return function
+    return register
+
+
+def _amplitude(amplitude, context):
+    # Legacy units: twists grow with the layer height, scales with the size
+    if context['way'] == 'twist':
+        return amplitude*context['height_per_layer']
+    if context['way'] == 'scale':
+        return amplitude*context['base_diameter']/100
+    return amplitude
+
+
+def _periodic(function, spec, z, context):
+    amplitude = spec['amplitude']
+    curve_offset = amplitude/2 if context.get('over_0', True) else 0
+    angle = 2*np.pi*(z + spec.get('phase', 0))/spec['period']
+    return curve_offset + _amplitude(amplitude, context)*function(angle)
+
+
+@profile_type('sin')
+def sin_profile(spec, z, context):
+    return _periodic(np.sin, spec, z, context)
+
+
+@profile_type('cos')
+def cos_profile(spec, z, context):
+    return _periodic(np.cos, spec, z, context)
+
+
+@profile_type('total_scale')
+def total_scale_profile(spec, z, context):
+    i = z/context['height_per_layer']
+    return i/context['n_points']*context['base_diameter']*(spec['scale'] - 1)
+
+
+@profile_type('constant')
+def constant_profile(spec, z, context):
+    i = z/context['height_per_layer']
+    return i*spec['value']/context['num_layers']
+
+
+@profile_type('piecewise_linear')
+def piecewise_linear_profile(spec, z, context):
+    # "points": [[z, value], ...], held constant outside the given range
+    points = np.asarray(spec['points'], dtype=np.float64)
+    return np.interp(z, points[:, 0], points[:, 1])
+
+
+@profile_type('spline')
+def spline_profile(spec, z, context):
+    # Natural cubic spline through "points": [[z, value], ...]
+    points = np.asarray(spec['points'], dtype=np.float64)
+    x, y = points[:, 0], points[:, 1]
+    n = len(x)
+    if n < 3:
+        return np.interp(z, x, y)
+    h = np.diff(x)
+    # second derivatives from the tridiagonal system, zero at both ends
+    system = np.zeros((n, n))
+    rhs = np.zeros(n)
+    system[0, 0] = system[-1, -1] = 1
+    k = np.arange(1, n - 1)
+    system[k, k - 1] = h[:-1]
+    system[k, k] = 2*(h[:-1] + h[1:])
+    system[k, k + 1] = h[1:]
+    rhs[k] = 6*((y[2:] - y[1:-1])/h[1:] - (y[1:-1] - y[:-2])/h[:-1])
+    m = np.linalg.solve(system, rhs)
+    zc = np.clip(z, x[0], x[-1])
+    j = np.clip(np.searchsorted(x, zc, side='right') - 1, 0, n - 2)
+    t0, t1 = x[j + 1] - zc, zc - x[j]
+    return (m[j]*t0**3/(6*h[j]) + m[j + 1]*t1**3/(6*h[j])
+            + (y[j]/h[j] - m[j]*h[j]/6)*t0 + (y[j + 1]/h[j] - m[j + 1]*h[j]/6)*t1)
+
+
+def evaluate_profile(spec, z, **context):
+    """One curve of a twists_list/scaling_list evaluated at heights z.
+
+    :param dict spec: curve description, e.g. {"type": "sin", ...}
+    :param np.ndarray z: heights in mm
+    :param context: height_per_layer, base_diameter, num_layers, n_points
+        and way ('twist' or 'scale')
+    :returns np.ndarray: values with the shape of z
+    """
+    if spec['type'] not in profile_types:
+        raise ValueError("unknown profile type %r, expected one of %s" % (spec['type'], sorted(profile_types)))
+    z = np.asarray(z, dtype=np.float64)
+    return profile_types[spec['type']](spec, z, context)
+
+
+def compose_profiles(specs, z, **context):
+    # Sum of all curves of a list, zero when the list is empty
+    total = np.zeros(np.shape(z))
+    for spec in specs:
+        total += evaluate_profile(spec, z, **context)
+    return total
+
+
+def layer_transforms(twists_list, scaling_list, z, height_per_layer, base_diameter, num_layers):
+    """Twist and scale between consecutive layer boundaries z.
+
+    Twist curves give the cumulative rotation in degrees, scale curves the
+    radial growth in mm; both are differenced into per-layer steps.
+
+    :returns tuple: (rota_list, scaling) float arrays of length len(z)-1
+    """
+    context = dict(height_per_layer=height_per_layer, base_diameter=base_diameter,
+                   num_layers=num_layers, n_points=num_layers+1)
+    twist = compose_profiles(twists_list, z, way='twist', **context)
+    radial = base_diameter + 2*compose_profiles(scaling_list, z, way='scale', **context)
+    return np.diff(twist), radial[1:]/radial[:-1]
+
+
+def simplify_polyline(points, tolerance, keep=()):
+    """Douglas-Peucker: indices of the points that keep a polyline within tolerance.
+
+    :param np.ndarray points: (n, d) polyline
+    :param float tolerance: max distance of a dropped point to its chord
+    :param keep: indices that are always kept, besides both ends
+    :returns np.ndarray: sorted indices of the kept points
+    """
+    points = np.asarray(points, dtype=np.float64)
+    n = len(points)
+    kept = np.zeros(n, dtype=bool)
+    kept[[0, n - 1]] = True
+    kept[list(keep)] = True
+    anchors = np.flatnonzero(kept)
+    stack = list(zip(anchors[:-1], anchors[1:]))
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        chord = points[b] - points[a]
+        rel = points[a+1:b] - points[a]
+        t = np.clip(rel @ chord/max(chord @ chord, 1e-300), 0, 1)
+        distance = np.linalg.norm(rel - t[:, None]*chord, axis=1)
+        k = np.argmax(distance)
+        if distance[k] > tolerance:
+            k += a + 1
+            kept[k] = True
+            stack.extend([(a, k), (k, b)])
+    return np.flatnonzero(kept)
+
+
+def adaptive_boundaries(z, rota_list, scaling, radius, tolerance, keep=()):
+    """Subset of the layer boundaries z that follows the twist/scale curves.
+
+    The outermost point of the outline (at radius) is traced through the
+    cumulative rotation and scale of every boundary; boundaries are dropped
+    while the straight slab between the remaining ones stays within
+    tolerance (mm) of that trace.
+
+    :param np.ndarray z: fine, uniform boundaries
+    :param rota_list: twist (degrees) between consecutive boundaries
+    :param scaling: scale between consecutive boundaries
+    :returns np.ndarray: indices into z of the kept boundaries
+    """
+    angle = np.radians(np.concatenate([[0], np.cumsum(rota_list)]))
+    size = radius*np.concatenate([[1], np.cumprod(scaling)])
+    trace = np.stack([size*np.cos(angle), size*np.sin(angle), z], axis=1)
+    return simplify_polyline(trace, tolerance, keep)
@@ -0,0 +1,343 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from batch_variants import render_variant
+from geometry_cache import config_key
+from kochLamp_layered import default_config
+
+reasons = {200: 'OK', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error', 503: 'Service Unavailable',
+           504: 'Gateway Timeout'}
+
+
+def _run_job(key, config_dict, output_dir, cache_dir, conn):
+    # Child process: renders one lamp and reports its STL path or the error;
+    # the parent already has the config
+    try:
+        conn.send(('done', render_variant(key, config_dict, output_dir, cache_dir)['stl']))
+    except Exception as e:
+        conn.send(('failed', repr(e)))
+    finally:
+        conn.close()
+
+
+def _wait_job(process, conn, timeout):
+    # Executor thread: reads the child's report while it runs, then joins it.
+    # A report larger than the pipe buffer blocks the child in send() until
+    # it is read, so joining first would wait for the timeout.
+    deadline = time.monotonic() + timeout
+    report = None
+    # poll also returns on EOF, when the child exits without a report
+    if conn.poll(timeout):
+        try:
+            report = conn.recv()
+        except EOFError:
+            pass
+    process.join(max(0, deadline - time.monotonic()))
+    return report
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RenderServer:
+    """Asyncio HTTP service rendering lamps in worker processes.
+
+    Routes:
+        POST /jobs              config JSON -> job status (202), deduplicated
+        POST /render            config JSON -> STL once rendered
+        GET  /jobs/<id>         job status
+        GET  /jobs/<id>/stl     STL of a finished job, 409 while pending
+        GET  /metrics           queue depth, job counts and timings
+
+    Jobs are keyed like the geometry cache, so a config that is queued,
+    running or done is answered by the existing job. At most workers jobs
+    run at once, each in its own process that is killed when it exceeds
+    timeout seconds; at most max_queue jobs wait, further ones get a 503
+    with Retry-After. Finished jobs and their STLs are dropped job_ttl
+    seconds after they finished, or oldest first once more than max_jobs
+    are kept.
+
+    :param str output_dir: where STLs are written, a temporary directory
+        when None
+    :param str cache_dir: optional GeometryCache directory shared by jobs
+    """
+
+    chunk_size = 1 << 16
+    max_body = 1 << 20
+
+    def __init__(self, host='127.0.0.1', port=8765, workers=None, max_queue=64, timeout=600,
+                 output_dir=None, cache_dir=None, max_jobs=1024, job_ttl=3600):
+        self.host = host
+        self.port = port
+        self.workers = workers or os.cpu_count()
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.output_dir = output_dir or tempfile.mkdtemp(prefix='koch-render-')
+        self.cache_dir = cache_dir
+        self.max_jobs = max_jobs
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        self.counters = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'done': 0, 'failed': 0, 'timeouts': 0,
+                         'evicted': 0}
+        self.running = 0
+        self.queue = None
+        self._server = None
+        self._tasks = []
+
+    async def start(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.queue = asyncio.Queue(self.max_queue)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        # port 0 picks a free one
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def serve_forever(self):
+        await self.start()
+        print("rendering on http://%s:%d with %d workers" % (self.host, self.port, self.workers))
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    def submit(self, config_dict):
+        # Job for config_dict, a new one unless an equal config is pending or done
+        if not isinstance(config_dict, dict):
+            raise HTTPError(400, "config must be a JSON object")
+        config_dict = dict(default_config, **config_dict)
+        key = config_key(config_dict)
+        self.evict()
+        job = self.jobs.get(key)
+        if job is not None and job['status'] != 'failed':
+            self.counters['deduplicated'] += 1
+            return job
+        if self.queue.full():
+            self.counters['rejected'] += 1
+            raise HTTPError(503, "render queue is full")
+        job = {
+            'id': key,
+            'status': 'queued',
+            'config': config_dict,
+            'submitted': time.time(),
+            'finished': asyncio.Event(),
+        }
+        self.jobs[key] = job
+        self.queue.put_nowait(job)
+        self.counters['submitted'] += 1
+        return job
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            self.running += 1
+            job['status'] = 'running'
+            job['started'] = time.time()
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(
+                target=_run_job, args=(job['id'], job['config'], self.output_dir, self.cache_dir, sender), daemon=True)
+            try:
+                process.start()
+                sender.close()
+                # wait in a thread so the event loop keeps serving
+                report = await loop.run_in_executor(None, _wait_job, process, receiver, self.timeout)
+                alive = process.is_alive()
+                if alive:
+                    process.kill()
+                    process.join()
+                if report is not None:
+                    job['status'], result = report
+                    job['stl' if job['status'] == 'done' else 'error'] = result
+                elif alive:
+                    self.counters['timeouts'] += 1
+                    job['status'], job['error'] = 'failed', "timed out after %g s" % self.timeout
+                else:
+                    job['status'], job['error'] = 'failed', "worker exited with code %s" % process.exitcode
+            except asyncio.CancelledError:
+                process.kill()
+                raise
+            finally:
+                receiver.close()
+                self.running -= 1
+                job['ended'] = time.time()
+                job['seconds'] = job['ended'] - job['started']
+                if job['status'] in ('done', 'failed'):
+                    self.counters[job['status']] += 1
+                job['finished'].set()
+                self.queue.task_done()
+                self.evict()
+
+    def evict(self, now=None):
+        # Drops finished jobs past job_ttl, then the oldest beyond max_jobs;
+        # queued and running jobs stay. Open STL downloads keep their file.
+        now = time.time() if now is None else now
+        finished = sorted((job for job in self.jobs.values() if 'ended' in job), key=lambda job: job['ended'])
+        excess = len(self.jobs) - self.max_jobs
+        for job in finished:
+            if job['ended'] > now - self.job_ttl and excess <= 0:
+                break
+            del self.jobs[job['id']]
+            excess -= 1
+            self.counters['evicted'] += 1
+            if 'stl' in job:
+                try:
+                    os.remove(job['stl'])
+                except OSError:
+                    pass
+
+    def metrics(self):
+        finished = [job['seconds'] for job in self.jobs.values() if 'seconds' in job]
+        return dict(
+            self.counters,
+            queue_depth=self.queue.qsize(),
+            max_queue=self.max_queue,
+            running=self.running,
+            workers=self.workers,
+            jobs=len(self.jobs),
+            mean_seconds=sum(finished)/len(finished) if finished else None,
+        )
+
+    @staticmethod
+    def status(job):
+        return {k: v for k, v in job.items() if k not in ('config', 'finished', 'stl')}
+
+    def _job(self, key):
+        if key not in self.jobs:
+            raise HTTPError(404, "unknown job %s" % key)
+        return self.jobs[key]
+
+    async def _handle(self, reader, writer):
+        try:
+            try:
+                method, path, body = await self._read_request(reader)
+                await self._route(method, path, body, writer)
+            except HTTPError as e:
+                headers = {'Retry-After': '5'} if e.status == 503 else {}
+                await self._send_json(writer, e.status, {'error': str(e)}, headers)
+            except Exception as e:
+                await self._send_json(writer, 500, {'error': repr(e)})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader):
+        line = (await reader.readline()).decode('latin-1').split()
+        if len(line) != 3:
+            raise HTTPError(400, "malformed request line")
+        headers = {}
+        while True:
+            header = (await reader.readline()).decode('latin-1').strip()
+            if not header:
+                break
+            name, _, value = header.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        if length > self.max_body:
+            raise HTTPError(413, "config larger than %d bytes" % self.max_body)
+        body = await reader.readexactly(length) if length else b''
+        return line[0].upper(), line[1], body
+
+    def _config(self, body):
+        try:
+            return json.loads(body.decode('utf-8'))
+        except ValueError as e:
+            raise HTTPError(400, "invalid JSON: %s" % e)
+
+    async def _route(self, method, path, body, writer):
+        url = urlsplit(path)
+        parts = [p for p in url.path.split('/') if p]
+        if parts == ['metrics'] and method == 'GET':
+            return await self._send_json(writer, 200, self.metrics())
+        if parts == ['jobs'] and method == 'POST':
+            job = self.submit(self._config(body))
+            return await self._send_json(writer, 202, self.status(job))
+        if parts == ['render'] and method == 'POST':
+            job = self.submit(self._config(body))
+            await job['finished'].wait()
+            return await self._send_stl(writer, job)
+        if len(parts) in (2, 3) and parts[0] == 'jobs' and method == 'GET':
+            job = self._job(parts[1])
+            if len(parts) == 2:
+                return await self._send_json(writer, 200, self.status(job))
+            if parts[2] == 'stl':
+                wait = parse_qs(url.query).get('wait', ['0'])[0] not in ('0', '')
+                if wait:
+                    await job['finished'].wait()
+                return await self._send_stl(writer, job)
+        if parts and parts[0] in ('metrics', 'jobs', 'render'):
+            raise HTTPError(405, "%s not allowed on %s" % (method, url.path))
+        raise HTTPError(404, "no route for %s" % url.path)
+
+    async def _send_head(self, writer, status, content_type, length, headers=None):
+        lines = ['HTTP/1.1 %d %s' % (status, reasons.get(status, '')),
+                 'Content-Type: ' + content_type,
+                 'Content-Length: %d' % length,
+                 'Connection: close']
+        lines.extend('%s: %s' % item for item in (headers or {}).items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    async def _send_json(self, writer, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        await self._send_head(writer, status, 'application/json', len(data), headers)
+        writer.write(data)
+        await writer.drain()
+
+    async def _send_stl(self, writer, job):
+        if job['status'] == 'failed':
+            status = 504 if job['error'].startswith('timed out') else 500
+            raise HTTPError(status, job['error'])
+        if job['status'] != 'done':
+            raise HTTPError(409, "job %s is %s" % (job['id'], job['status']))
+        # streamed chunk by chunk, drain() holds back slow clients
+        await self._send_head(writer, 200, 'model/stl', os.path.getsize(job['stl']),
+                              {'Content-Disposition': 'attachment; filename="%s.stl"' % job['id'][:16]})
+        with open(job['stl'], 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve lamp renders over HTTP")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--max-queue', type=int, default=64)
+    parser.add_argument('--timeout', type=float, default=600, help="seconds before a job is killed")
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--cache-dir', default=None)
+    parser.add_argument('--max-jobs', type=int, default=1024, help="finished jobs kept at most")
+    parser.add_argument('--job-ttl', type=float, default=3600, help="seconds a finished job and its STL are kept")
+    args = parser.parse_args()
+
+    server = RenderServer(args.host, args.port, args.workers, args.max_queue, args.timeout,
+                          args.output_dir, args.cache_dir, args.max_jobs, args.job_ttl)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,256 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import contextlib
+import json
+import numbers
+import numpy as np
+
+
+def _fields(node):
+    # solid2 keeps these underscored, SolidPython 1 did not
+    name = getattr(node, '_name', None) or getattr(node, 'name')
+    params = getattr(node, '_params', None)
+    if params is None:
+        params = getattr(node, 'params', {})
+    children = getattr(node, '_children', None)
+    if children is None:
+        children = getattr(node, 'children', [])
+    modifier = getattr(node, '_modifier', None) or getattr(node, 'modifier', '') or ''
+    return name, params, children, modifier
+
+
+def format_value(value):
+    if value is None:
+        return 'undef'
+    if isinstance(value, (bool, np.bool_)):
+        return 'true' if value else 'false'
+    if isinstance(value, numbers.Integral):
+        return str(int(value))
+    if isinstance(value, numbers.Real):
+        return repr(float(value))
+    if isinstance(value, str):
+        return json.dumps(value)
+    if isinstance(value, np.ndarray):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return '[' + ', '.join(format_value(v) for v in value) + ']'
+    return str(value)
+
+
+def format_call(name, params):
+    # name(key = value, ...) with sorted keys, `_fn` style keys become `$fn`
+    args = []
+    for key in sorted(params):
+        if params[key] is None:
+            continue
+        scad_key = '$' + key[1:] if key.startswith('_') else key
+        args.append('%s = %s' % (scad_key, format_value(params[key])))
+    return '%s(%s)' % (name, ', '.join(args))
+
+
+def count_nodes(root):
+    # Distinct node objects in a solid2 tree, shared sub-trees counted once
+    seen = set()
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.extend(_fields(node)[2])
+    return len(seen)
+
+
+class _Graph:
+    # Object tree folded into a DAG of structurally distinct nodes
+    def __init__(self, root):
+        self.nodes = []     # key -> (call, child keys, modifier)
+        self.uses = []      # key -> number of references from distinct parents
+        interned = {}
+        by_id = {}
+        stack = [(root, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in by_id:
+                continue
+            name, params, children, modifier = _fields(node)
+            if not ready:
+                stack.append((node, True))
+                stack.extend((c, False) for c in children if id(c) not in by_id)
+                continue
+            signature = (modifier, format_call(name, params), tuple(by_id[id(c)] for c in children))
+            key = interned.get(signature)
+            if key is None:
+                key = interned[signature] = len(self.nodes)
+                self.nodes.append(signature[1:] + (modifier,))
+                self.uses.append(0)
+                for child in signature[2]:
+                    self.uses[child] += 1
+            by_id[id(node)] = key
+        self.root = by_id[id(root)]
+
+
+def _render(graph, key, names, out, depth=0):
+    # Writes the node `key` itself and inlines or calls its descendants
+    stack = [(key, depth, 'expand')]
+    while stack:
+        key, depth, state = stack.pop()
+        indent = '\t'*depth
+        if state == 'close':
+            out.append(indent + '}\n')
+            continue
+        if state == 'node' and key in names:
+            out.append(indent + names[key] + '();\n')
+            continue
+        call, children, modifier = graph.nodes[key]
+        if not children:
+            out.append(indent + modifier + call + ';\n')
+            continue
+        out.append(indent + modifier + call + ' {\n')
+        stack.append((key, depth, 'close'))
+        stack.extend((c, depth + 1, 'node') for c in reversed(children))
+
+
+def scad_render_modules(root, min_uses=2, min_length=64):
+    """Renders a solid2 object tree to SCAD, sharing repeated sub-trees.
+
+    Sub-trees that are the same Python object or render identically are
+    collected once; any that is referenced min_uses times or more is
+    written as a `module` and called, so the file grows with the number of
+    distinct sub-trees instead of the size of the expanded tree.
+
+    :param root: solid2 object
+    :param int min_uses: references needed before a sub-tree becomes a module
+    :param int min_length: leaves with a shorter call are always inlined
+    :returns str: SCAD source
+    """
+    graph = _Graph(root)
+    names = {}
+    for key, (call, children, modifier) in enumerate(graph.nodes):
+        if key != graph.root and graph.uses[key] >= min_uses and (children or len(call) >= min_length):
+            names[key] = 'm%d' % len(names)
+    out = []
+    # keys are in post order, so every module is defined after its callees
+    for key, name in names.items():
+        out.append('module %s() {\n' % name)
+        _render(graph, key, names, out, depth=1)
+        out.append('}\n\n')
+    _render(graph, graph.root, names, out)
+    return ''.join(out)
+
+
+def save_scad(root, filename, **kwargs):
+    with open(filename, 'w') as f:
+        f.write(scad_render_modules(root, **kwargs))
+    return filename
+
+
+class ScadWriter:
+    """Writes SCAD statements straight to a file, without a solid2 tree.
+
+    The primitive methods only format a call, e.g. translate([0, 0, 2]) ->
+    'translate(v = [0, 0, 2])'; statement() writes a chain of calls ending
+    in a leaf and block() opens a chain whose children follow. Floats get a
+    fixed number of decimals and point arrays are formatted in one go.
+
+    :param f: text file, ideally opened with a large buffer
+    :param int precision: decimals written for every float
+    """
+
+    def __init__(self, f, precision=6):
+        self.f = f
+        self.depth = 0
+        self.float_format = '%%.%df' % precision
+
+    def number(self, value):
+        if isinstance(value, (bool, np.bool_)) or not isinstance(value, numbers.Real):
+            return format_value(value)
+        if isinstance(value, numbers.Integral):
+            return str(int(value))
+        text = self.float_format % value
+        if '.' in text:
+            text = text.rstrip('0').rstrip('.')
+        return '0' if text == '-0' else text
+
+    def value(self, value):
+        if isinstance(value, np.ndarray) and value.ndim == 2:
+            return self.array(value)
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return '[' + ', '.join(self.value(v) for v in value) + ']'
+        return self.number(value)
+
+    def array(self, values):
+        # (n, d) array as a nested SCAD vector, formatted by one % operation
+        values = np.asarray(values)
+        if len(values) == 0:
+            return '[]'
+        item = self.float_format if values.dtype.kind == 'f' else '%d'
+        row = '[' + ', '.join([item]*values.shape[1]) + ']'
+        return '[' + ', '.join([row]*len(values)) % tuple(values.ravel().tolist()) + ']'
+
+    def call(self, name, **params):
+        # name(key = value, ...) with sorted keys, `_fn` style keys become `$fn`
+        args = []
+        for key in sorted(params):
+            if params[key] is None:
+                continue
+            scad_key = '$' + key[1:] if key.startswith('_') else key
+            args.append('%s = %s' % (scad_key, self.value(params[key])))
+        return '%s(%s)' % (name, ', '.join(args))
+
+    def polygon(self, points, paths=None):
+        return self.call('polygon', points=np.asarray(points, dtype=np.float64)[:, :2], paths=paths)
+
+    def polyhedron(self, points, faces):
+        # Counter-clockwise (outward) faces are flipped into OpenSCAD's order
+        faces = np.asarray(faces)[:, ::-1]
+        return self.call('polyhedron', points=np.asarray(points, dtype=np.float64), faces=faces)
+
+    def linear_extrude(self, height, twist=0, scale=1, slices=1):
+        return self.call('linear_extrude', height=height, twist=twist, scale=scale, slices=slices)
+
+    def translate(self, v):
+        return self.call('translate', v=v)
+
+    def rotate(self, a):
+        return self.call('rotate', a=a)
+
+    def scale(self, v):
+        return self.call('scale', v=v)
+
+    def offset(self, r=None, delta=None, _fn=None):
+        return self.call('offset', r=r, delta=delta, _fn=_fn)
+
+    def union(self):
+        return 'union()'
+
+    def difference(self):
+        return 'difference()'
+
+    def statement(self, *calls):
+        self.f.write('\t'*self.depth + ' '.join(calls) + ';\n')
+
+    @contextlib.contextmanager
+    def block(self, *calls):
+        self.f.write('\t'*self.depth + ' '.join(calls) + ' {\n')
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            self.f.write('\t'*self.depth + '}\n')
+
+    def module(self, name):
+        return self.block('module %s()' % name)
+
+    def use(self, name):
+        # Call of a module defined with module(), for use as a leaf
+        return '%s()' % name
+
+
+@contextlib.contextmanager
+def open_scad(filename, precision=6, buffer_size=1 << 20):
+    # ScadWriter on a buffered file, use as `with open_scad(name) as w:`
+    with open(filename, 'w', buffering=buffer_size) as f:
+        yield ScadWriter(f, precision)
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import struct
+import numpy as np
+
+# One binary STL facet: normal, three corners and the attribute byte count
+STL_FACET = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attr', '<u2')])
+
+
+def face_normals(triangles):
+    # Unit normals of (k, 3, 3) triangles, zero for degenerate ones
+    normals = np.cross(triangles[:, 1] - triangles[:, 0], triangles[:, 2] - triangles[:, 0])
+    length = np.linalg.norm(normals, axis=1)
+    length[length == 0] = 1
+    return normals/length[:, None]
+
+
+def iter_mesh_triangles(vertices, faces, chunk_size=1 << 16):
+    # (k, 3, 3) corner coordinates of an indexed mesh, chunk by chunk
+    vertices = np.asarray(vertices)
+    faces = np.asarray(faces)
+    for start in range(0, len(faces), chunk_size):
+        yield vertices[faces[start:start + chunk_size]]
+
+
+def write_stl(filename, triangles, binary=True, name='kochLamp'):
+    """Streams triangles to an STL file.
+
+    Nothing but the current chunk is held in memory: binary files get a zero
+    facet count first, which is patched into the header once all chunks
+    have been written.
+
+    :param str filename: output path
+    :param triangles: iterable of (k, 3, 3) arrays, e.g. one per layer
+    :param bool binary: write binary STL, ASCII STL otherwise
+    :param str name: solid name stored in the header
+    :returns int: number of facets written
+    """
+    count = 0
+    if binary:
+        with open(filename, 'wb') as f:
+            f.write(name.encode('ascii', 'replace')[:80].ljust(80, b' '))
+            f.write(struct.pack('<I', 0))
+            for chunk in triangles:
+                chunk = np.asarray(chunk, dtype=np.float64)
+                facets = np.zeros(len(chunk), dtype=STL_FACET)
+                facets['normal'] = face_normals(chunk)
+                facets['vertices'] = chunk
+                f.write(facets.tobytes())
+                count += len(chunk)
+            f.seek(80)
+            f.write(struct.pack('<I', count))
+        return count
+    facet = ("facet normal %e %e %e\n outer loop\n"
+             "  vertex %e %e %e\n  vertex %e %e %e\n  vertex %e %e %e\n"
+             " endloop\nendfacet\n")
+    with open(filename, 'w') as f:
+        f.write("solid %s\n" % name)
+        for chunk in triangles:
+            chunk = np.asarray(chunk, dtype=np.float64)
+            rows = np.concatenate([face_normals(chunk), chunk.reshape(-1, 9)], axis=1)
+            f.write((facet*len(rows)) % tuple(rows.ravel()))
+            count += len(chunk)
+        f.write("endsolid %s\n" % name)
+    return count
+
+
+def save_mesh_stl(filename, vertices, faces, binary=True, chunk_size=1 << 16):
+    # Indexed mesh to STL without expanding all triangles at once
+    return write_stl(filename, iter_mesh_triangles(vertices, faces, chunk_size), binary=binary)
@@ -0,0 +1,41 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+pytest.importorskip('solid2')
+
+from kochLamp_layered import KochSnowflake_creator, default_config
+
+base_config = dict(
+    default_config,
+    koch_iterations=2,
+    height=100,
+    wall_thickness=2,
+    scaling_list=[{"type": "cos", "amplitude": 5, "period": 100, "phase": 0}],
+)
+
+
+@pytest.mark.parametrize('changes', [
+    {'height': 50},
+    {'height_per_layer': 5},
+    {'wall_thickness': 5},
+    {'chamfer_r': 1},
+    {'koch_iterations': 3, 'base_diameter': 60},
+    {'twists_list': [{"type": "sin", "amplitude": 20, "period": 100, "phase": 0}]},
+    {'adaptive_tolerance': 0.1},
+])
+def test_attributes_set_directly_match_a_fresh_creator(changes):
+    creator = KochSnowflake_creator(base_config)
+    creator.create_mesh()
+    for name, value in changes.items():
+        setattr(creator, name, value)
+    fresh = KochSnowflake_creator(dict(base_config, **changes))
+    for cached, expected in zip(creator.get_sweep_inputs(), fresh.get_sweep_inputs()):
+        if expected is None or np.isscalar(expected):
+            assert cached == expected
+        else:
+            np.testing.assert_allclose(cached, expected)
+    for cached, expected in zip(creator.create_mesh(), fresh.create_mesh()):
+        np.testing.assert_array_equal(cached, expected)
@@ -0,0 +1,40 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip('solid2')
+
+import geometry_cache
+from geometry_cache import GeometryCache
+from kochLamp_layered import KochSnowflake_creator, default_config
+
+small_config = dict(default_config, koch_iterations=1, height=10)
+
+
+def test_evict_skips_entries_removed_by_another_worker(tmp_path, monkeypatch):
+    cache = GeometryCache(str(tmp_path), max_bytes=0)
+    for key in ('a', 'b'):
+        os.makedirs(str(tmp_path/key))
+        with open(str(tmp_path/key/'model.stl'), 'wb') as f:
+            f.write(b'x'*100)
+    getsize = os.path.getsize
+
+    def racing_getsize(path):
+        # the other worker's rmtree lands between listdir and getsize
+        shutil.rmtree(str(tmp_path/'a'), ignore_errors=True)
+        return getsize(path)
+    monkeypatch.setattr(geometry_cache.os.path, 'getsize', racing_getsize)
+    cache.evict()
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_scad_miss_does_not_build_the_solid2_tree(tmp_path, monkeypatch):
+    def create(self):
+        raise AssertionError("create() called")
+    monkeypatch.setattr(KochSnowflake_creator, 'create', create)
+    entry = GeometryCache(str(tmp_path)).get_or_create(small_config, scad=True)
+    assert os.path.getsize(entry['files']['scad']) > 0
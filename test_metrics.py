@@ -0,0 +1,28 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import numpy as np
+import pytest
+
+pytest.importorskip('solid2')
+
+from kochLamp_layered import KochSnowflake_creator, config
+
+
+def mesh_area(vertices, faces):
+    t = vertices[faces]
+    return 0.5*np.linalg.norm(np.cross(t[:, 1] - t[:, 0], t[:, 2] - t[:, 0]), axis=1).sum()
+
+
+@pytest.mark.parametrize('preset, changes', [
+    ('neutral', {'koch_iterations': 0}),
+    ('neutral', {}),
+    ('testing', {}),
+    ('Lamp', {}),
+    ('testing', {'koch_iterations': 2, 'chamfer_r': 0.3}),
+    ('neutral', {'koch_iterations': 2, 'fractal': 'minkowski'}),
+])
+def test_surface_area_matches_the_mesh(preset, changes):
+    creator = KochSnowflake_creator(dict(config[preset], **changes))
+    surface_area = creator.get_metrics()['surface_area']
+    assert surface_area == pytest.approx(mesh_area(*creator.create_mesh()), rel=5e-3)
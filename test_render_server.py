@@ -0,0 +1,49 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+import multiprocessing
+
+import pytest
+
+pytest.importorskip('solid2')
+
+from render_server import RenderServer, _wait_job
+
+pipe_buffer = 1 << 16
+
+
+def _send_large(conn):
+    conn.send(('done', 'x'*(4*pipe_buffer)))
+    conn.close()
+
+
+def test_wait_job_reads_reports_larger_than_the_pipe_buffer():
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_send_large, args=(sender,), daemon=True)
+    process.start()
+    sender.close()
+    report = _wait_job(process, receiver, 10)
+    assert not process.is_alive()
+    assert report == ('done', 'x'*(4*pipe_buffer))
+
+
+def test_large_config_renders_before_the_timeout(tmp_path):
+    # a piecewise linear twist of 8000 points makes the config ~2 pipe buffers
+    points = [[100*i/7999, 10*(i % 2)] for i in range(8000)]
+    config_dict = {'koch_iterations': 1, 'height': 10, 'twists_list': [{'type': 'piecewise_linear', 'points': points}]}
+    assert len(json.dumps(config_dict)) > 2*pipe_buffer
+
+    async def render():
+        server = await RenderServer(port=0, workers=1, timeout=10, output_dir=str(tmp_path)).start()
+        try:
+            job = server.submit(config_dict)
+            await job['finished'].wait()
+            return job
+        finally:
+            await server.close()
+
+    job = asyncio.run(render())
+    assert job['status'] == 'done', job.get('error')
+    assert job['seconds'] < 10
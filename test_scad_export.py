@@ -0,0 +1,61 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import json
+import re
+
+import numpy as np
+import pytest
+
+pytest.importorskip('solid2')
+
+from kochLamp_layered import KochSnowflake_creator, default_config
+
+twisted_config = dict(
+    default_config,
+    koch_iterations=2,
+    height=20,
+    wall_thickness=2,
+    twists_list=[{"type": "sin", "amplitude": 20, "period": 100, "phase": 0}],
+    scaling_list=[{"type": "cos", "amplitude": 5, "period": 100, "phase": 0}],
+)
+
+polygon_pattern = re.compile(r'(?:scale\(v = \[([-\d.e]+), [-\d.e]+, 1\]\) rotate\(a = \[0, 0, ([-\d.e]+)\]\) )?'
+                             r'polygon\(points = (\[.*?\]\])')
+layer_pattern = re.compile(r'translate\(v = \[0, 0, ([-\d.e]+)\]\).*scale\(v = \[([-\d.e]+), [-\d.e]+, 1\]\) '
+                           r'rotate\(a = \[0, 0, ([-\d.e]+)\]\) (\w+)\(\);')
+
+
+def transform(ring, scale, angle):
+    p = (ring[:, 0] + 1j*ring[:, 1])*scale*np.exp(1j*np.radians(angle))
+    return np.stack([p.real, p.imag], axis=1)
+
+
+def read_scad(filename):
+    # Polygons of the outline and wall modules, under the transforms written
+    # in front of them, and (z, scale, angle, module) per layer
+    with open(filename) as f:
+        source = f.read()
+    polygons = [transform(np.array(json.loads(p)), float(s or 1), float(a or 0))
+                for s, a, p in polygon_pattern.findall(source)]
+    layers = [(float(z), float(s), float(a), name) for z, s, a, name in layer_pattern.findall(source)]
+    return polygons, layers
+
+
+def test_write_scad_rings_match_mesh(tmp_path):
+    creator = KochSnowflake_creator(twisted_config)
+    vertices, _ = creator.create_mesh()
+    _, _, _, z, _, hollow_from = creator.get_sweep_inputs()
+    filename = str(tmp_path/'lamp.scad')
+    creator.write_scad(filename)
+    polygons, layers = read_scad(filename)
+    assert len(polygons) == 2 and len(layers) == len(z) - 1
+    for i, (height, scale, angle, name) in enumerate(layers):
+        assert name == ('wall' if i >= hollow_from else 'outline')
+        rings = polygons if name == 'wall' else polygons[:1]
+        at_height = vertices[np.abs(vertices[:, 2] - z[i]) < 1e-9, :2]
+        for ring in rings:
+            # every SCAD vertex of the layer is a vertex of the mesh ring there
+            points = transform(ring, scale, angle)
+            gap = np.min(np.linalg.norm(points[:, None] - at_height[None], axis=2), axis=1)
+            assert gap.max() < 1e-4
@@ -0,0 +1,214 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from batch_variants import expand_variants
+from kochLamp_layered import KochSnowflake_creator
+from mesh_sweep import sweep_mesh
+
+# Level of detail used for previews: outline levels and rings kept at most
+preview_lod = {'max_iterations': 3, 'max_rings': 32}
+
+
+def write_png(filename, image):
+    # (h, w, 3) uint8 image as an 8-bit RGB PNG, no filtering
+    image = np.ascontiguousarray(image, dtype=np.uint8)
+    height, width = image.shape[:2]
+    raw = np.zeros((height, 1 + 3*width), dtype=np.uint8)
+    raw[:, 1:] = image.reshape(height, -1)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+    return filename
+
+
+def _view(azimuth, elevation):
+    # Rows: screen right, screen up and towards the camera, in world axes
+    a, e = np.radians(azimuth), np.radians(elevation)
+    right = np.array([np.cos(a), np.sin(a), 0])
+    toward = np.array([np.sin(a)*np.cos(e), -np.cos(a)*np.cos(e), np.sin(e)])
+    return np.stack([right, np.cross(toward, right), toward])
+
+
+def render_mesh(vertices, faces, size=(256, 256), azimuth=30, elevation=25, color=(230, 190, 120),
+                background=(255, 255, 255), light=(-0.4, -0.6, 0.7), ambient=0.3, chunk_size=1 << 22):
+    """Flat shaded orthographic picture of a triangle mesh.
+
+    Front faces are scan converted all at once: every face expands into
+    one span per pixel row it covers, every pixel of a span gets the depth
+    of the face's plane and the nearest sample per pixel wins. The mesh is fitted into the
+    image with a small margin.
+
+    :param vertices: (V, 3) or (L, P, 3) coordinates, e.g. a tower mesh
+    :param faces: (F, 3) counter-clockwise faces
+    :param tuple size: (width, height) in pixels
+    :returns np.ndarray: (height, width, 3) uint8 image
+    """
+    vertices = np.asarray(vertices, dtype=np.float64).reshape(-1, 3)
+    faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+    width, height = size
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[:] = background
+    if not len(faces):
+        return image
+    view = _view(azimuth, elevation)
+    corners = vertices[faces]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    front = normals @ view[2] > 0
+    faces, normals = faces[front], normals[front]
+    light = np.asarray(light, dtype=np.float64)/np.linalg.norm(light)
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-300)[:, None]
+    shade = ambient + (1 - ambient)*np.clip(normals @ light, 0, 1)
+
+    # screen coordinates: x to the right, y down, depth towards the camera
+    screen = vertices @ view.T
+    low, high = screen[:, :2].min(axis=0), screen[:, :2].max(axis=0)
+    fit = 0.92*min(width, height)/max((high - low).max(), 1e-12)
+    x = (screen[:, 0] - (low[0] + high[0])/2)*fit + width/2
+    y = height/2 - (screen[:, 1] - (low[1] + high[1])/2)*fit
+    tx, ty, tz = x[faces], y[faces], screen[faces, 2]
+
+    # twice the signed screen area and the depth gradient of every face
+    area = (tx[:, 1] - tx[:, 0])*(ty[:, 2] - ty[:, 0]) - (tx[:, 2] - tx[:, 0])*(ty[:, 1] - ty[:, 0])
+    keep = area != 0
+    tx, ty, tz, area, owner = tx[keep], ty[keep], tz[keep], area[keep], np.flatnonzero(keep)
+    gx = ((tz[:, 1] - tz[:, 0])*(ty[:, 2] - ty[:, 0]) - (tz[:, 2] - tz[:, 0])*(ty[:, 1] - ty[:, 0]))/area
+    gy = ((tz[:, 2] - tz[:, 0])*(tx[:, 1] - tx[:, 0]) - (tz[:, 1] - tz[:, 0])*(tx[:, 2] - tx[:, 0]))/area
+
+    # one span per face and pixel row, cut from the row's centre line
+    y0 = np.clip(np.ceil(ty.min(axis=1) - 0.5), 0, height).astype(np.int64)
+    y1 = np.clip(np.floor(ty.max(axis=1) - 0.5), -1, height - 1).astype(np.int64)
+    rows = np.maximum(y1 - y0 + 1, 0)
+    face = np.repeat(np.arange(len(tx)), rows)
+    py = y0[face] + np.arange(rows.sum()) - np.repeat(np.cumsum(rows) - rows, rows)
+    cy = py + 0.5
+    left = np.full(len(face), np.inf)
+    right = np.full(len(face), -np.inf)
+    for i in range(3):
+        xa, ya = tx[face, i], ty[face, i]
+        xb, yb = tx[face, (i + 1) % 3], ty[face, (i + 1) % 3]
+        cross = (np.minimum(ya, yb) <= cy) & (cy <= np.maximum(ya, yb)) & (ya != yb)
+        x = xa + (cy - ya)*(xb - xa)/np.where(cross, yb - ya, 1)
+        left = np.where(cross, np.minimum(left, x), left)
+        right = np.where(cross, np.maximum(right, x), right)
+    x0 = np.clip(np.ceil(left - 0.5), 0, width).astype(np.int64)
+    x1 = np.clip(np.floor(right - 0.5), -1, width - 1).astype(np.int64)
+    counts = np.maximum(x1 - x0 + 1, 0)
+
+    pixels, depths, owners = [], [], []
+    ends = np.cumsum(counts)
+    first = 0
+    while first < len(counts) and ends[-1]:
+        last = max(first + 1, np.searchsorted(ends, ends[first] - counts[first] + chunk_size, side='right'))
+        sel = np.arange(first, min(last, len(counts)))
+        first = sel[-1] + 1
+        cnt = counts[sel]
+        span = np.repeat(sel, cnt)
+        px = x0[span] + np.arange(cnt.sum()) - np.repeat(np.cumsum(cnt) - cnt, cnt)
+        f = face[span]
+        pixels.append(py[span]*width + px)
+        depths.append(tz[f, 0] + gx[f]*(px + 0.5 - tx[f, 0]) + gy[f]*(cy[span] - ty[f, 0]))
+        owners.append(owner[f])
+    if not pixels:
+        return image
+    pixels, depths, owners = np.concatenate(pixels), np.concatenate(depths), np.concatenate(owners)
+    # nearest sample per pixel: sort by pixel, then by decreasing depth
+    order = np.lexsort((-depths, pixels))
+    pixels, owners = pixels[order], owners[order]
+    first = np.ones(len(pixels), dtype=bool)
+    first[1:] = pixels[1:] != pixels[:-1]
+    flat = image.reshape(-1, 3)
+    flat[pixels[first]] = np.clip(shade[owners[first], None]*np.asarray(color, dtype=np.float64), 0, 255)
+    return image
+
+
+def lod_sweep_inputs(outline, angles, scales, z, inner=None, hollow_from=None, max_rings=32):
+    """Sweep inputs with layers merged down to about max_rings rings.
+
+    Every k-th ring is kept, plus the top and the ring where the inner
+    wall starts, so the silhouette follows the twist/scale curves coarsely.
+    """
+    n = len(z)
+    if n <= max_rings:
+        return outline, angles, scales, z, inner, hollow_from
+    keep = np.zeros(n, dtype=bool)
+    keep[::int(np.ceil(n/max_rings))] = True
+    keep[-1] = True
+    if hollow_from is not None and hollow_from < n:
+        keep[hollow_from] = True
+        hollow_from = int(np.count_nonzero(keep[:hollow_from]))
+    return outline, np.asarray(angles)[keep], np.asarray(scales)[keep], np.asarray(z)[keep], inner, hollow_from
+
+
+def lamp_preview(config_dict, lod=True, **kwargs):
+    # Thumbnail image of a lamp config, coarser outline and layers with lod
+    config_dict = dict(config_dict)
+    if lod:
+        config_dict['koch_iterations'] = min(config_dict['koch_iterations'], preview_lod['max_iterations'])
+    creator = KochSnowflake_creator(config_dict)
+    inputs = creator.get_sweep_inputs()
+    if lod:
+        inputs = lod_sweep_inputs(*inputs, max_rings=preview_lod['max_rings'])
+    return render_mesh(*sweep_mesh(*inputs), **kwargs)
+
+
+def render_thumbnail(key, config_dict, output_dir, lod=True, size=(256, 256)):
+    # Worker: writes one PNG and returns a manifest row
+    start = time.perf_counter()
+    filename = os.path.join(output_dir, key[:16] + '.png')
+    write_png(filename, lamp_preview(config_dict, lod, size=size))
+    return {'key': key, 'config': config_dict, 'png': filename, 'seconds': time.perf_counter() - start}
+
+
+def run_thumbnails(spec, workers=None, output_dir='thumbnails', lod=True, size=(256, 256)):
+    """PNG thumbnails of every variant of a variations spec, in a process pool.
+
+    :returns list: manifest rows in spec order, with 'error' for failures
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    variants = expand_variants(spec)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_thumbnail, key, cfg, output_dir, lod, size): (key, cfg)
+                   for key, cfg in variants}
+        for future in as_completed(futures):
+            key, cfg = futures[future]
+            try:
+                rows.append(future.result())
+            except Exception as e:
+                rows.append({'key': key, 'config': cfg, 'error': repr(e)})
+    order = {key: i for i, (key, _) in enumerate(variants)}
+    rows.sort(key=lambda row: order[row['key']])
+    with open(os.path.join(output_dir, 'thumbnails.json'), 'w') as f:
+        json.dump(rows, f, indent=4)
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Render PNG thumbnails of every variant of a variations file")
+    parser.add_argument('spec', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'variations.config'))
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--output-dir', default='thumbnails')
+    parser.add_argument('--size', type=int, nargs=2, default=[256, 256], metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--full', action='store_true', help="render the full outline and every layer")
+    args = parser.parse_args()
+
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+    start = time.perf_counter()
+    rows = run_thumbnails(spec, args.workers, args.output_dir, not args.full, tuple(args.size))
+    print("%d thumbnails in %.1f s" % (len(rows), time.perf_counter() - start))
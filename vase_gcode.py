@@ -0,0 +1,177 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import math
+import numpy as np
+
+from mesh_sweep import signed_area
+from polygon_offset import offset_polygon, offset_polygons
+
+# Printer and material settings, lengths in mm and speeds in mm/s
+default_settings = {
+    "nozzle_diameter": 0.4,
+    "extrusion_width": None,    # 1.125 nozzle diameters when None
+    "layer_height": 0.2,
+    "filament_diameter": 1.75,
+    "extrusion_multiplier": 1.0,
+    "feed_rate": 30,
+    "floor_feed_rate": 20,
+    "travel_rate": 150,
+    "center": [100, 100],
+    "nozzle_temperature": 210,
+    "bed_temperature": 60,
+}
+
+start_gcode = """G21 ; millimetres
+G90 ; absolute coordinates
+M83 ; relative extrusion
+M140 S{bed_temperature}
+M104 S{nozzle_temperature}
+G28
+M190 S{bed_temperature}
+M109 S{nozzle_temperature}
+G92 E0
+"""
+
+end_gcode = """G91
+G1 Z5 F600
+G90
+M104 S0
+M140 S0
+M84
+"""
+
+move = "G1 X%.3f Y%.3f Z%.3f E%.5f\n"
+
+
+def ring_at(z_layers, angles, scales, zz):
+    """Complex transform of the outline at arbitrary heights.
+
+    Between two layer boundaries the lamp walls run straight from ring to
+    ring, so the outline at height zz is the blend interpolate_ring gives.
+
+    :returns np.ndarray: complex scale*exp(i*angle) per height
+    """
+    z_layers = np.asarray(z_layers, dtype=np.float64)
+    i = np.clip(np.searchsorted(z_layers, zz, side='right') - 1, 0, len(z_layers) - 2)
+    t = np.clip((zz - z_layers[i])/(z_layers[i + 1] - z_layers[i]), 0, 1)
+    w0 = scales[i]*np.exp(1j*np.radians(angles[i]))
+    w1 = scales[i + 1]*np.exp(1j*np.radians(angles[i + 1]))
+    return (1 - t)*w0 + t*w1
+
+
+class _Writer:
+    # Formats moves chunk by chunk and keeps the running totals
+    def __init__(self, f, settings):
+        self.f = f
+        self.center = complex(*settings['center'])
+        radius = settings['filament_diameter']/2
+        self.e_per_mm3 = settings['extrusion_multiplier']/(math.pi*radius*radius)
+        self.width = settings['extrusion_width']
+        self.position = None
+        self.moves = 0
+        self.filament = 0.0
+        self.seconds = 0.0
+
+    def travel(self, point, z, rate):
+        point = complex(point) + self.center
+        self.f.write("G0 X%.3f Y%.3f Z%.3f F%d\n" % (point.real, point.imag, z, rate*60))
+        if self.position is not None:
+            self.seconds += abs(point - self.position)/rate
+        self.position = point
+
+    def extrude(self, points, z, thickness, rate):
+        # points complex (n,), z and thickness per point, feed in mm/s
+        points = points + self.center
+        length = np.abs(np.diff(np.concatenate([[self.position], points])))
+        e = length*self.width*thickness*self.e_per_mm3
+        rows = np.column_stack([points.real, points.imag, np.broadcast_to(z, points.shape), e])
+        self.f.write("G1 F%d\n" % (rate*60))
+        self.f.write((move*len(rows)) % tuple(rows.ravel().tolist()))
+        self.position = points[-1]
+        self.moves += len(rows)
+        self.filament += e.sum()
+        self.seconds += length.sum()/rate
+
+
+def write_vase_gcode(filename, outline, angles, scales, z, floor_height=0, revolutions_per_chunk=16, **settings):
+    """Streams spiral vase G-code for a lamp straight from its layer profile.
+
+    The floor (up to floor_height) is printed as flat layers of concentric
+    loops. Above it a single wall, half an extrusion width inside the
+    outline, is walked continuously while z rises by layer_height per
+    revolution; every point gets the twist and scale interpolated at its
+    own height, exactly like the swept mesh. The first revolution ramps its
+    flow up from zero. Extrusion is relative (M83) and computed per segment
+    from its length, the extrusion width and the layer height.
+
+    :param outline: (n, 2) base outline
+    :param angles: cumulative rotation in degrees at every layer boundary z
+    :param scales: cumulative scale at every layer boundary z
+    :param z: increasing layer boundaries, the last one is the top
+    :param float floor_height: height of the solid bottom
+    :param settings: overrides of default_settings
+    :returns dict: moves, filament_mm and an estimated print time in seconds
+    """
+    unknown = set(settings) - set(default_settings)
+    if unknown:
+        raise ValueError("unknown G-code settings %s" % sorted(unknown))
+    settings = dict(default_settings, **settings)
+    if settings['extrusion_width'] is None:
+        settings['extrusion_width'] = 1.125*settings['nozzle_diameter']
+    lh, width = settings['layer_height'], settings['extrusion_width']
+    angles = np.asarray(angles, dtype=np.float64)
+    scales = np.asarray(scales, dtype=np.float64)
+    z = np.asarray(z, dtype=np.float64)
+    outline = np.asarray(outline, dtype=np.float64)[:, :2]
+    if signed_area(outline) < 0:
+        outline = outline[::-1]
+
+    # wall centre line, closed so every revolution ends where the next starts
+    path = offset_polygon(outline, -width/2)
+    path = path[:, 0] + 1j*path[:, 1]
+    closed = np.concatenate([path, path[:1]])
+    fraction = np.concatenate([[0], np.cumsum(np.abs(np.diff(closed)))])
+    fraction = fraction[1:]/fraction[-1]
+    path = closed[1:]
+
+    with open(filename, 'w', buffering=1 << 20) as f:
+        out = _Writer(f, settings)
+        f.write(start_gcode.format(**settings))
+        top = z[-1]
+
+        # floor: concentric loops, each layer under the transform at its height
+        n_floor = int(round(floor_height/lh))
+        if n_floor:
+            loops = []
+            k = 0
+            while True:
+                rings = offset_polygons(outline, -width*(k + 0.5))
+                if not rings:
+                    break
+                loops.extend(r[:, 0] + 1j*r[:, 1] for r in rings)
+                k += 1
+            for layer in range(1, n_floor + 1):
+                height = layer*lh
+                w = ring_at(z, angles, scales, height)
+                for loop in loops:
+                    points = np.concatenate([loop, loop[:1]])*w
+                    out.travel(points[0], height, settings['travel_rate'])
+                    out.extrude(points[1:], height, lh, settings['floor_feed_rate'])
+
+        # spiral wall
+        start = n_floor*lh
+        revolutions = int(math.ceil((top - start)/lh))
+        out.travel(path[-1]*ring_at(z, angles, scales, start), start, settings['travel_rate'])
+        for first in range(0, revolutions, revolutions_per_chunk):
+            k = np.arange(first, min(first + revolutions_per_chunk, revolutions))
+            zz = (start + (k[:, None] + fraction[None, :])*lh).ravel()
+            points = np.tile(path, len(k))
+            keep = zz <= top + 1e-9
+            zz, points = zz[keep], points[keep]
+            if not len(zz):
+                break
+            thickness = np.minimum(zz - start, lh)
+            out.extrude(points*ring_at(z, angles, scales, zz), zz, thickness, settings['feed_rate'])
+        f.write(end_gcode)
+    return {'moves': out.moves, 'filament_mm': float(out.filament), 'seconds': float(out.seconds)}